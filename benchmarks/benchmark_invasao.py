@@ -0,0 +1,184 @@
+# Mede a velocidade do modo em lote e da ordenação do invasao-sem-builtin.py
+#
+# Ex: python benchmarks/benchmark_invasao.py --lote 200000
+#
+# As respostas são conferidas pelos testes em tests/test_invasao.py; aqui só
+# se mede o tempo.
+
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+
+# O nome do arquivo tem hífens, então não dá para usar um import normal
+CAMINHO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "invasao-sem-builtin.py")
+especificacao = importlib.util.spec_from_file_location("invasao_sem_builtin", CAMINHO)
+invasao = importlib.util.module_from_spec(especificacao)
+# Registrado em sys.modules para as funções poderem ir para os processos do pool
+sys.modules["invasao_sem_builtin"] = invasao
+especificacao.loader.exec_module(invasao)
+
+
+def ordenar_por_gnomo(lista_original):
+    """Cria uma versão ordenada de uma lista usando o GnomeSort (O(n²)).
+
+    Era a implementação original de ordenar_lista; fica aqui para comparação
+    no benchmark_ordenacao.
+    """
+    # Implementação do GnomeSort, copiada da wikipedia
+    # veja: https://en.wikipedia.org/wiki/Gnome_sort
+    # veja: https://pt.wikipedia.org/wiki/Gnome_sort
+
+    # Faça uma cópia para não modificar a lista original
+    lista = list(lista_original)
+    pivot = 0
+    lista_length = len(lista)
+    while pivot < lista_length - 1:
+        if lista[pivot] > lista[pivot + 1]:
+            temp = lista[pivot + 1]
+            lista[pivot + 1] = lista[pivot]
+            lista[pivot] = temp
+            if pivot > 0:
+                pivot -= 2
+        pivot += 1
+    return lista
+
+
+def benchmark_em_lote(quantidade):
+    """Mede quantas mensagens por segundo o modo em lote consegue decodificar."""
+    mensagens = invasao.gerar_mensagens(quantidade)
+
+    inicio = time.perf_counter()
+    for registro in invasao.resolucao_em_lote(mensagens):
+        pass
+    duracao = time.perf_counter() - inicio
+
+    print("Mensagens: " + str(quantidade))
+    print("Tempo: %.3f s" % duracao)
+    print("Mensagens por segundo: %.0f" % (quantidade / duracao))
+    print("Cache da sequência A: %d acertos, %d falhas" % (invasao.SEQUENCIA_A.acertos, invasao.SEQUENCIA_A.falhas))
+    print("Cache da sequência B: %d acertos, %d falhas" % (invasao.SEQUENCIA_B.acertos, invasao.SEQUENCIA_B.falhas))
+
+
+def benchmark_ordenacao(tamanhos):
+    """Compara o tempo de cada algoritmo de ordenação para listas de vários tamanhos.
+
+    As listas têm números entre 0 e 499, como os números da parte M.
+    Os algoritmos O(n²) são pulados nas listas maiores que 2048 elementos.
+    """
+    gerador = random.Random(0)
+    algoritmos = [
+        ["gnomo", ordenar_por_gnomo, True],
+        ["insercao", lambda lista: invasao.ordenar_por_insercao(lista, 0, len(lista)) or lista, True],
+        ["intercalacao", invasao.ordenar_por_intercalacao, False],
+        ["contagem", lambda lista: invasao.ordenar_por_contagem(lista, 0, 499), False],
+        ["ordenar_lista", invasao.ordenar_lista, False],
+    ]
+
+    print("%8s" % "tamanho" + "".join(["%15s" % algoritmo[0] for algoritmo in algoritmos]))
+    for tamanho in tamanhos:
+        # Para listas pequenas, repetimos várias vezes para o tempo ser mensurável
+        # (uma lista vazia conta como tamanho 1)
+        repeticoes = max(1, 20000 // max(1, tamanho))
+        listas = []
+        for r in range(0, repeticoes):
+            listas.append([gerador.randint(0, 499) for i in range(0, tamanho)])
+
+        linha = "%8d" % tamanho
+        for nome, ordenar, quadratico in algoritmos:
+            if quadratico and tamanho > 2048:
+                linha = linha + "%15s" % "-"
+                continue
+
+            copias = [list(lista) for lista in listas]
+            inicio = time.perf_counter()
+            for lista in copias:
+                ordenar(lista)
+            duracao = time.perf_counter() - inicio
+
+            linha = linha + "%13.2fus" % (duracao / repeticoes * 1e6)
+        print(linha)
+
+
+def benchmark_numpy(quantidades, tamanho_do_bloco=100000):
+    """Compara o modo em lote em Python puro com o modo em lote com NumPy.
+
+    Para não medir o tempo de gerar as mensagens, um bloco de até
+    `tamanho_do_bloco` mensagens é gerado uma vez e repetido até completar
+    cada quantidade.
+    """
+    if invasao.numpy is None:
+        print("O NumPy não está instalado.")
+        return
+
+    bloco = invasao.gerar_mensagens(min(tamanho_do_bloco, max(quantidades)))
+
+    print("%12s%14s%14s%10s" % ("mensagens", "python (s)", "numpy (s)", "ganho"))
+    for quantidade in quantidades:
+        tempos = []
+        for resolver in [invasao.resolucao_em_lote, invasao.resolucao_em_lote_numpy]:
+            inicio = time.perf_counter()
+            faltam = quantidade
+            while faltam > 0:
+                for registro in resolver(bloco[:faltam]):
+                    pass
+                faltam = faltam - len(bloco)
+            tempos.append(time.perf_counter() - inicio)
+
+        print("%12d%14.3f%14.3f%9.2fx" % (quantidade, tempos[0], tempos[1], tempos[0] / tempos[1]))
+
+
+def benchmark_processos(quantidade, tamanho_da_fatia=1 << 20):
+    """Mede o modo com vários processos com 1, 2, 4... processos até o número de CPUs."""
+    mensagens = invasao.gerar_mensagens(quantidade)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "mensagens.txt")
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            arquivo.write("\n".join(mensagens) + "\n")
+
+        print("%10s%12s%14s" % ("processos", "tempo (s)", "mensagens/s"))
+        processos = 1
+        while True:
+            with open(os.devnull, "w", encoding="utf-8") as saida:
+                inicio = time.perf_counter()
+                invasao.resolver_arquivo_em_paralelo(caminho, saida, processos, tamanho_da_fatia)
+                duracao = time.perf_counter() - inicio
+
+            print("%10d%12.3f%14.0f" % (processos, duracao, quantidade / duracao))
+
+            if processos >= os.cpu_count():
+                break
+            processos = min(processos * 2, os.cpu_count())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mede a velocidade do invasao-sem-builtin.py.")
+    parser.add_argument("--lote", metavar="N", type=int,
+                        help="mede a velocidade do modo em lote com N mensagens aleatórias")
+    parser.add_argument("--processos", metavar="N", type=int,
+                        help="mede o modo com vários processos com N mensagens aleatórias")
+    parser.add_argument("--numpy", metavar="N", type=int, nargs="*",
+                        help="compara o modo em lote com e sem NumPy para N mensagens")
+    parser.add_argument("--ordenacao", metavar="TAMANHO", type=int, nargs="*",
+                        help="compara os algoritmos de ordenação nos TAMANHOs de lista dados")
+    opcoes = parser.parse_args()
+
+    if opcoes.lote is not None:
+        benchmark_em_lote(opcoes.lote)
+    elif opcoes.processos is not None:
+        benchmark_processos(opcoes.processos)
+    elif opcoes.numpy is not None:
+        benchmark_numpy(opcoes.numpy or [1000, 100000, 10000000])
+    elif opcoes.ordenacao is not None:
+        benchmark_ordenacao(opcoes.ordenacao or [4, 10, 16, 64, 256, 1024, 4096, 65536])
+    else:
+        parser.error("escolha o que medir: --lote, --processos, --numpy ou --ordenacao")
+
+
+if __name__ == "__main__":
+    main()
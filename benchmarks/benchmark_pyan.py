@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    benchmark_pyan.py - Time each phase of pyan on real or synthetic code.
+
+    Usage: python benchmarks/benchmark_pyan.py [FILENAME...] [--synthetic SPEC] [--repeat N]
+           python benchmarks/benchmark_pyan.py --lookup
+
+    Prints the per-phase timings as JSON. The results themselves are
+    checked by the tests in tests/; this script only measures.
+"""
+
+import sys
+import ast
+import os
+import os.path
+import random
+import tempfile
+import time
+import json
+from glob import glob
+from optparse import OptionParser
+try:
+    import resource  # for peak memory (not available on Windows)
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pyan import CallGraphVisitor, get_module_name, write_chunked
+
+def generate_synthetic_project(directory, n_modules=50, n_classes=20, n_functions=1,
+                               method_names=("__init__", "get", "run", "close", "update"),
+                               collision_rate=1.0, seed=0):
+    """Write a synthetic Python project into directory, for benchmarking.
+
+    Each module has n_classes classes, each defining the methods in
+    method_names, each using the previous one through self. Each module also
+    has n_functions functions: n_functions - 1 functions in a chain, and main(),
+    which uses the classes imported from the previous module (and the last
+    function of the chain).
+
+    collision_rate is the fraction of the method and function names that
+    are the same in every class or module (chosen at random, with seed); the
+    others are made unique. With the default 1.0, every method name has
+    n_modules * n_classes Nodes. Return the list of filenames."""
+
+    rng = random.Random(seed)
+    def pick_name(name, suffix):
+        return name if rng.random() < collision_rate else "%s_%s" % (name, suffix)
+
+    filenames = []
+    for i in range(n_modules):
+        lines = []
+        if i > 0:
+            lines.append("from mod%d import %s" % (i-1, ", ".join("C%d_%d" % (i-1, j) for j in range(n_classes))))
+        for j in range(n_classes):
+            lines.append("class C%d_%d:" % (i, j))
+            names = [pick_name(method, "%d_%d" % (i, j)) for method in method_names]
+            for k, method in enumerate(names):
+                lines.append("    def %s(self):" % (method))
+                if k > 0:
+                    lines.append("        self.%s()" % (names[k-1]))
+                else:
+                    lines.append("        pass")
+        functions = [pick_name("func%d" % (k), "%d" % (i)) for k in range(n_functions - 1)]
+        for k, function in enumerate(functions):
+            lines.append("def %s():" % (function))
+            lines.append("    %s()" % (functions[k-1]) if k > 0 else "    pass")
+        lines.append("def main():")
+        for j in range(n_classes if i > 0 else 0):
+            lines.append("    x = C%d_%d()" % (i-1, j))
+            lines.append("    x.run()")
+        if functions:
+            lines.append("    %s()" % (functions[-1]))
+        lines.append("    pass")
+
+        filename = os.path.join(directory, "mod%d.py" % (i))
+        with open(filename, "wt", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        filenames.append(filename)
+    return filenames
+
+def parse_synthetic_spec(spec):
+    """Parse the --synthetic option, e.g. "files=50,classes=20,functions=1,collisions=1.0",
+    into keyword arguments for generate_synthetic_project(). Raise ValueError if invalid."""
+
+    keys = {"files": ("n_modules", int), "classes": ("n_classes", int),
+            "functions": ("n_functions", int), "collisions": ("collision_rate", float)}
+    kwargs = {}
+    for item in spec.split(","):
+        key, sep, value = item.partition("=")
+        if not sep or key.strip() not in keys:
+            raise ValueError("Invalid --synthetic item '%s': expected one of %s, as KEY=VALUE" % (item, ", ".join(keys)))
+        arg, convert = keys[key.strip()]
+        try:
+            kwargs[arg] = convert(value)
+        except ValueError:
+            raise ValueError("Invalid --synthetic item '%s': %s must be a number" % (item, key.strip()))
+    return kwargs
+
+def get_peak_rss():
+    """Return the peak resident memory of this process in bytes, or None if not available."""
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # kilobytes on Linux
+
+def benchmark(filenames, repeat=1):
+    """Analyze filenames and write the graph in every format, timing each phase.
+
+    The phases are read, symtable, parse and visit (summed over the files),
+    each pass of postprocess(), and each output format (written to the null
+    device). Files that cannot be analyzed are skipped. With repeat > 1, the
+    whole run is repeated and the fastest time of each phase is kept.
+
+    Return the results as a dict, for JSON output: the times in seconds, and
+    the peak resident memory in bytes after each phase (None if not
+    available on this platform)."""
+
+    peak_rss = {}
+    def timed(phase, f, *args):
+        start = time.perf_counter()
+        result = f(*args)
+        elapsed = time.perf_counter() - start
+        phases[phase] = phases.get(phase, 0.0) + elapsed
+        return result
+
+    best = {}
+    for run in range(repeat):
+        phases = {}
+        skipped = []
+        n_ast_nodes = 0
+        v = CallGraphVisitor(filenames)
+        for filename in filenames:
+            v.module_name = get_module_name(filename)
+            v.file_id = v.file_ids[filename]
+            phase = "read"
+            try:
+                content = timed(phase, v.read, filename)
+                phase = "symtable"
+                timed(phase, v.analyze_scopes, content, filename)
+                phase = "parse"
+                tree = timed(phase, ast.parse, content, filename)
+                phase = "visit"
+                timed(phase, v.visit, tree)
+            except Exception as e:  # e.g. a syntax error, or Python code that pyan doesn't understand
+                skipped.append({"file": filename, "phase": phase, "error": "%s: %s" % (type(e).__name__, e)})
+                v.abandon_file()
+                continue
+            n_ast_nodes += sum(1 for node in ast.walk(tree))
+            v.ast_ids = {}
+            v.module_name = None
+        peak_rss["analysis"] = get_peak_rss()
+
+        for postprocess in (v.contract_nonexistents, v.expand_unknowns, v.cull_inherited):
+            timed(postprocess.__name__, postprocess)
+            peak_rss[postprocess.__name__] = get_peak_rss()
+
+        with open(os.devnull, "wt", encoding="utf-8") as f:
+            timed("dot", write_chunked, f, v.iter_dot(draw_defines=True, draw_uses=True, colored=True,
+                                                      grouped=True, nested_groups=True, annotate=True))
+            peak_rss["dot"] = get_peak_rss()
+            timed("tgf", write_chunked, f, v.iter_tgf(draw_defines=True, draw_uses=True))
+            peak_rss["tgf"] = get_peak_rss()
+            timed("jsonl", write_chunked, f, v.iter_jsonl(draw_defines=True, draw_uses=True))
+            peak_rss["jsonl"] = get_peak_rss()
+        with open(os.devnull, "wb") as f:
+            timed("binary", v.write_binary, f, True, True)
+            peak_rss["binary"] = get_peak_rss()
+
+        for phase, seconds in phases.items():
+            best[phase] = min(best.get(phase, seconds), seconds)
+
+    n_nodes = sum(len(ns) for ns in v.nodes.values())
+    return {"python": sys.version.split()[0],
+            "files": len(filenames),
+            "skipped": skipped,
+            "ast_nodes": n_ast_nodes,
+            "nodes": n_nodes,
+            "defines_edges": sum(len(edges) for edges in v.defines_edges.values()),
+            "uses_edges": sum(len(edges) for edges in v.uses_edges.values()),
+            "repeat": repeat,
+            "seconds": best,
+            "total_seconds": sum(best.values()),
+            "peak_rss": peak_rss}
+
+def benchmark_node_lookup(n_modules=50, n_classes=20):
+    """Benchmark the analysis of a synthetic project with many same-named
+    methods, and compare Node lookups through the (namespace, name) index
+    with the linear scan over the Nodes of the same name."""
+
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = generate_synthetic_project(directory, n_modules, n_classes)
+
+        start = time.perf_counter()
+        v = CallGraphVisitor(filenames)
+        v.process_files(filenames)
+        analyzed = time.perf_counter()
+
+    keys = list(v.node_index)
+    largest = max(len(ns) for ns in v.nodes.values())
+    print("%d files, %d nodes (up to %d with the same name)" % (len(filenames), len(keys), largest))
+    print("analysis: %.3f s" % (analyzed - start))
+
+    start = time.perf_counter()
+    for namespace, name in keys:
+        v.find_node(namespace, name)
+    indexed = time.perf_counter() - start
+
+    def scan(namespace, name):
+        for n in v.nodes.get(name, ()):
+            if n.namespace == namespace:
+                return n
+        return None
+    start = time.perf_counter()
+    for namespace, name in keys:
+        scan(namespace, name)
+    scanned = time.perf_counter() - start
+
+    print("lookup of every node: index %.4f s, linear scan %.4f s (%.1fx)" % (indexed, scanned, scanned / indexed))
+
+def main():
+    usage = """usage: %prog [FILENAME...] [--synthetic SPEC] [--repeat N] | --lookup"""
+    desc = """Time each phase of the analysis of the files (or of a synthetic project, if none are given) and of writing the output, and print the results as JSON."""
+    parser = OptionParser(usage=usage, description=desc)
+    parser.add_option("--synthetic",
+                      dest="synthetic", default=None, metavar="SPEC",
+                      help="parameters of the synthetic project, e.g. "
+                           "files=50,classes=20,functions=1,collisions=1.0 (fraction of shared method names)")
+    parser.add_option("--repeat",
+                      type="int", dest="repeat", default=1, metavar="N",
+                      help="run N times and report the fastest time of each phase [default: %default]")
+    parser.add_option("--lookup",
+                      action="store_true", default=False, dest="lookup",
+                      help="benchmark node lookup on a synthetic project instead")
+
+    options, args = parser.parse_args()
+    if options.lookup:
+        benchmark_node_lookup()
+        return
+    if args and options.synthetic is not None:
+        parser.error('--synthetic cannot be combined with filenames')
+    if args:
+        results = benchmark([fn2 for fn in args for fn2 in glob(fn)], options.repeat)
+        results["synthetic"] = None
+    else:
+        try:
+            spec = parse_synthetic_spec(options.synthetic) if options.synthetic is not None else {}
+        except ValueError as e:
+            parser.error(e.args[0])
+        with tempfile.TemporaryDirectory() as directory:
+            results = benchmark(generate_synthetic_project(directory, **spec), options.repeat)
+        results["synthetic"] = spec
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
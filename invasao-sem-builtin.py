@@ -1,36 +1,193 @@
 # Esse código tenta resolver a lista de exercícios "INVASÃO" de ALP
 
+import argparse
+from array import array
+import mmap
+import multiprocessing
+import os
+import random
+import sys
+
+try:
+    import numpy
+except ImportError:
+    # O NumPy é opcional: sem ele, o modo em lote usa só Python puro
+    numpy = None
+
 
 def se_par(numero):
     """Retorna se um número é par (boolean)."""
     return numero % 2 == 0
 
 
+# --- DÍGITOS ---
+#
+# Em vez de tirar um dígito por vez com % 10, os números são quebrados em
+# blocos de 4 dígitos com divmod(numero, 10000), e a soma dos dígitos de cada
+# bloco vem de uma tabela com as respostas de 0 a 9999.
+
+def montar_tabela_soma_dos_digitos():
+    """Cria a tabela com a soma dos dígitos de todo número de 0 a 9999."""
+    tabela = bytearray(10000)
+    for numero in range(1, 10000):
+        # Os dígitos de numero são os de numero // 10 mais o último
+        tabela[numero] = tabela[numero // 10] + numero % 10
+    return bytes(tabela)
+
+
+def montar_tabela_dos_digitos():
+    """Cria a tabela com os 4 dígitos (com zeros à esquerda) de todo número de 0 a 9999."""
+    tabela = []
+    for numero in range(0, 10000):
+        tabela.append((numero // 1000, numero // 100 % 10, numero // 10 % 10, numero % 10))
+    return tabela
+
+
+SOMA_DOS_DIGITOS_ATE_9999 = montar_tabela_soma_dos_digitos()
+DIGITOS_ATE_9999 = montar_tabela_dos_digitos()
+
+
 def soma_dos_digitos(soma):
     """Soma os dígitos de um número e retorna esse valor como número."""
+    soma = int(soma)
     somador = 0
 
-    while int(soma) > 0:
-        somador += int(soma) % 10
-        soma = int(soma) // 10
+    while soma > 0:
+        soma, bloco = divmod(soma, 10000)
+        somador += SOMA_DOS_DIGITOS_ATE_9999[bloco]
     return somador
 
 
+def ultimos_digitos(numero, quantidade):
+    """Retorna os `quantidade` (até 4) últimos dígitos de um número, como lista.
+
+    Números com menos dígitos retornam só os que têm, e 0 (ou negativos)
+    não têm dígitos, assim como na lista_dos_digitos:
+        ultimos_digitos(12345, 2) -> [4, 5]
+        ultimos_digitos(7, 2) -> [7]
+        ultimos_digitos(0, 2) -> []
+    """
+    numero = int(numero)
+    if numero <= 0:
+        return []
+
+    digitos = DIGITOS_ATE_9999[numero % 10000]
+    if numero >= 10 ** quantidade:
+        return list(digitos[4 - quantidade:])
+
+    # O número inteiro tem menos que `quantidade` dígitos: pula os zeros à esquerda
+    inicio = 3
+    while inicio > 0 and numero >= 10 ** (4 - inicio):
+        inicio = inicio - 1
+    return list(digitos[inicio:])
+
+
+def somas_dos_ultimos_digitos(numeros, quantidade):
+    """Soma os `quantidade` (até 4) últimos dígitos de cada número.
+
+    Ex: somas_dos_ultimos_digitos([33, 191, 5], 2) -> [6, 10, 5]
+
+    Args:
+        numeros: Uma lista de inteiros, ou um array do NumPy de inteiros
+            não negativos (aí o resultado também é um array).
+        quantidade (int): Quantos dígitos do final somar (de 1 a 4).
+    Retorna:
+        As somas, na mesma ordem.
+    """
+    modulo = 10 ** quantidade
+
+    if numpy is not None and isinstance(numeros, numpy.ndarray):
+        tabela = numpy.frombuffer(SOMA_DOS_DIGITOS_ATE_9999, dtype=numpy.uint8)
+        return tabela[numeros % modulo].astype(numpy.int64)
+
+    somas = []
+    for numero in numeros:
+        if numero > 0:
+            somas.append(SOMA_DOS_DIGITOS_ATE_9999[numero % modulo])
+        else:
+            somas.append(0)
+    return somas
+
+
+# --- REDUÇÕES ---
+#
+# Soma, produto e uma redução genérica sobre qualquer iterável. Todas são
+# feitas com um laço (e não com recursão em lista[1:], que copiava o resto
+# da lista a cada passo e estourava o limite de recursão em ~1000 itens).
+
+def reduzir(operacao, iteravel, valor_se_vazio):
+    """Aplica `operacao` acumulando da esquerda para a direita.
+
+    Ex: reduzir(f, [a, b, c], v) -> f(f(a, b), c)
+    Ex: reduzir(f, [], v) -> v
+
+    Args:
+        operacao (função): Função de dois argumentos (acumulado, item).
+        iteravel (iterável): Qualquer iterável (lista, gerador, ...).
+        valor_se_vazio: O que retornar se o iterável não tiver itens.
+    Retorna:
+        O valor acumulado.
+    """
+    itens = iter(iteravel)
+    acumulado = next(itens, valor_se_vazio)
+
+    for item in itens:
+        acumulado = operacao(acumulado, item)
+
+    return acumulado
+
+
 def soma_da_lista(lista_a_ser_usada):
-    """Retorna a soma dos itens de uma lista."""
-    if lista_a_ser_usada == []:
-        return 0
-    else:
-        return lista_a_ser_usada[0] + soma_da_lista(lista_a_ser_usada[1:])
+    """Retorna a soma dos itens de uma lista (ou de qualquer iterável).
 
+    Começa do primeiro item em vez de 0, então também concatena strings e
+    listas: ['a', 'b'] -> 'ab'. Uma lista vazia soma 0.
+    """
+    return reduzir(lambda acumulado, item: acumulado + item, lista_a_ser_usada, 0)
+
+
+# A partir desse tamanho, produtos de inteiros são feitos em árvore
+LIMITE_DO_PRODUTO_EM_ARVORE = 32
+
+
+def multiplicacao_da_lista(lista_a_ser_usada):
+    """Retorna o produto dos itens de uma lista (ou de qualquer iterável).
+
+    Ex: [2, 3, 4] -> 24
+    Ex: ['a', 3] -> 'aaa'
+    Uma lista vazia multiplica 1.
+    """
+    lista = list(lista_a_ser_usada)
+
+    if len(lista) >= LIMITE_DO_PRODUTO_EM_ARVORE and intervalo_dos_inteiros(lista) != None:
+        return produto_em_arvore(lista)
 
-def esta_em(elemento, lista):
-    """Retorna True se um elemento está na lista, senão retorna False."""
-    for i in range(0, len(lista)):
-        if lista[i] == elemento:
-            return True
+    return reduzir(lambda acumulado, item: acumulado * item, lista, 1)
 
-    return False
+
+def produto_em_arvore(numeros):
+    """Multiplica uma lista de inteiros dois a dois, como um torneio.
+
+    [a, b, c, d, e] -> [a*b, c*d, e] -> [a*b*c*d, e] -> [a*b*c*d*e]
+
+    Multiplicar da esquerda para a direita faz um número cada vez maior ser
+    multiplicado por números pequenos; em árvore, os dois lados de cada
+    multiplicação têm tamanhos parecidos, o que é bem mais rápido para
+    inteiros grandes.
+    """
+    if numeros == []:
+        return 1
+
+    rodada = list(numeros)
+    while len(rodada) > 1:
+        proxima = []
+        for i in range(0, len(rodada) - 1, 2):
+            proxima.append(rodada[i] * rodada[i + 1])
+        if len(rodada) % 2 == 1:
+            proxima.append(rodada[-1])
+        rodada = proxima
+
+    return rodada[0]
 
 
 def pedir_numeros_para_o_usuario(entrada):
@@ -51,48 +208,90 @@ def pedir_numeros_para_o_usuario(entrada):
     Retorna:
         Uma lista de números.
     """
-    lista_de_numeros = []
-
-    numero_atual = 0
-    digitos_do_numero_atual = 0
-
     # Se a entrada for "" é um sinal que nós mesmos temos que pedir a entrada ao usuário.
     # Quando estamos testando essa função, vale a pena dar entradas diferentes de ""
     # para simular entradas que o usuário tivesse colocado manualmente.
     if entrada == "":
         entrada = input("Digite os numeros separados por espaços:")
 
-    for i in range(0, len(entrada)):
-        caractere = entrada[i]
+    return converter_para_numeros(entrada)
 
-        # Se o número for um dígito, continue calculando o número atual
-        if esta_em(caractere, '0123456789') != False:
-            numero_atual = numero_atual * 10 + int(caractere)
-            digitos_do_numero_atual = digitos_do_numero_atual + 1
 
-        # Se um dos caracteres não for um número, quer dizer que chegamos no
-        # final do número anterior e temos que ver se devemos adicionar esse número
-        # para a nossa lista_de_numeros
+def tabela_de_separadores():
+    """Cria a tabela usada por bytes.translate() para separar os números.
+
+    Cada um dos 256 valores de byte é mapeado para ele mesmo se for um dígito
+    ASCII ('0' a '9'), e para um espaço caso contrário. Assim qualquer
+    caractere que não seja um dígito vira separador, como sempre foi, e
+    caracteres acentuados (vários bytes em UTF-8) também viram separadores.
+    """
+    tabela = bytearray()
+    for byte in range(0, 256):
+        if ord("0") <= byte <= ord("9"):
+            tabela.append(byte)
         else:
-            # Verifica se por acaso não digitamos dois espaços consecutivos
-            if digitos_do_numero_atual > 0:
-                # Ok, é um número de verdade que o usuário digitou
-                lista_de_numeros = lista_de_numeros + [numero_atual]
+            tabela.append(ord(" "))
+    return bytes(tabela)
+
+
+SEPARADORES = tabela_de_separadores()
+
 
-                # Prepara algumas variáveis para processarmos o próximo número
-                numero_atual = 0
-                digitos_do_numero_atual = 0
+def converter_para_numeros(entrada):
+    """Igual a pedir_numeros_para_o_usuario, mas nunca chama input().
+
+    Usada pelo modo em lote, onde uma linha vazia é só uma mensagem vazia
+    e não um pedido para o usuário digitar algo.
+
+    Em vez de olhar caractere por caractere, trocamos todos os não-dígitos
+    por espaços com bytes.translate() e separamos com split(): as duas coisas
+    passam uma vez só por cada byte, então o custo é linear no tamanho da entrada.
+
+    Args:
+        entrada (str ou bytes): Uma sequência de caracteres contendo números.
+    Retorna:
+        Uma lista de números.
+    """
+    if isinstance(entrada, str):
+        entrada = entrada.encode("utf-8")
+
+    return [int(numero) for numero in entrada.translate(SEPARADORES).split()]
+
+
+class ErroDeValidacao:
+    """Diz por que uma mensagem é inválida; é o que partes_decodificadas retorna nesse caso.
+
+    Atributos:
+        motivo (str): Código curto do erro, um dos MOTIVOS_DE_ERRO.
+        posicao (int): Índice, na lista de números da mensagem, do número
+            que causou o erro (ou o tamanho da mensagem, se faltou número).
+        texto (str): Descrição do erro para mostrar ao usuário.
+    """
 
-    # Verifica se o último caractere a ser digitado era um número a ser finalizado
-    if digitos_do_numero_atual > 0:
-        # Ok, é um número de verdade que o usuário digitou
-        lista_de_numeros = lista_de_numeros + [numero_atual]
+    def __init__(self, motivo, posicao, texto):
+        self.motivo = motivo
+        self.posicao = posicao
+        self.texto = texto
 
-    return lista_de_numeros
+    def __repr__(self):
+        return "<ErroDeValidacao %s na posição %d: %s>" % (self.motivo, self.posicao, self.texto)
+
+
+MOTIVOS_DE_ERRO = ["mensagem_curta", "M_maior_que_5", "valor_M_maior_que_500", "N_maior_que_10"]
 
 
 # Nessa função criaremos a 2º e 3ºpartes da mensagem
-def partes_decodificadas(Codigo):
+# Se a mensagem for inválida, retorna um ErroDeValidacao em vez das partes
+# (com verboso=False o erro não é impresso, útil para o modo em lote)
+def partes_decodificadas(Codigo, verboso=True):
+    # Sem os números M e N não tem nem como começar (ex: uma linha vazia num arquivo)
+    if len(Codigo) < 2:
+        erro = ErroDeValidacao("mensagem_curta", len(Codigo),
+                               "A mensagem precisa ter pelo menos os números M e N.")
+        if verboso:
+            print("ERRO: " + erro.texto)
+        return erro
+
     # A "Parte formada de M números" inicia na posição 2 (terceiro item) da lista
     ptM_posicao_inicio = 2
     # "Parte formada de M números" terá uma quantidade de elementos igual ao número M da posição 0
@@ -102,10 +301,12 @@ def partes_decodificadas(Codigo):
     if numero_M <= 5:
         pass
     else:
-        # "None" é um sinal pro programa que algo deu errado e outra input
-        # deve ser pedido
-        print("ERRO: O número M é maior que 5.")
-        return None
+        # O ErroDeValidacao é um sinal pro programa que algo deu errado e outra input
+        # deve ser pedido (ou, no modo em lote, que a mensagem deve ser rejeitada)
+        erro = ErroDeValidacao("M_maior_que_5", 0, "O número M é maior que 5.")
+        if verboso:
+            print("ERRO: " + erro.texto)
+        return erro
 
     # O final da ptM será igual a posicao de inicio somada ao numeros de elementos
     ptM_posicao_fim = ptM_posicao_inicio + numero_M
@@ -120,8 +321,11 @@ def partes_decodificadas(Codigo):
     for i in range(0, len(ptM)):
         if ptM[i] >= 500:
             # Uh-oh, tivemos um erro e precisamos pedir pro usuário redigitar
-            print("ERRO: Um dos números M (" + str(ptM[i]) + " é maior que 500.")
-            return None
+            erro = ErroDeValidacao("valor_M_maior_que_500", ptM_posicao_inicio + i,
+                                   "Um dos números M (" + str(ptM[i]) + ") é maior que 500.")
+            if verboso:
+                print("ERRO: " + erro.texto)
+            return erro
 
     # A ptN começará na posição seguinte a posição final da ptM
     ptN_posicao_inicio = ptM_posicao_fim
@@ -131,11 +335,10 @@ def partes_decodificadas(Codigo):
     if ptN_numero_elementos <= 10:
         pass
     else:
-        ptN_numero_elementos = 10
-        # "None" é um sinal pro programa que algo deu errado e outra input
-        # deve ser pedido
-        print("ERRO: O número N é maior que 10.")
-        return None
+        erro = ErroDeValidacao("N_maior_que_10", 1, "O número N é maior que 10.")
+        if verboso:
+            print("ERRO: " + erro.texto)
+        return erro
 
 
     # O final da ptN será igual a posicao de inicio somada ao numeros de elementos
@@ -176,19 +379,11 @@ def lista_dos_pares(lista_1, lista_2):
     lista_com_pares = []
 
     for index in range(0, ate):
-        lista_com_pares = lista_com_pares + [[lista_1[index], lista_2[index]]]
+        lista_com_pares.append([lista_1[index], lista_2[index]])
 
     return lista_com_pares
 
 
-def multiplicacao_da_lista(lista_a_ser_usada):
-    """Retorna o produto dos itens de uma lista."""
-    if lista_a_ser_usada == []:
-        return 1
-    else:
-        return lista_a_ser_usada[0] * multiplicacao_da_lista(lista_a_ser_usada[1:])
-
-
 def produto_dos_pares(lista_de_pares):
     """Transforma uma lista de pares em uma lista da multiplicação dos pares.
 
@@ -203,97 +398,244 @@ def produto_dos_pares(lista_de_pares):
     """
     lista_multiplicada = []
 
-    for i in range(0, len(lista_de_pares)):
-        lista_multiplicada = lista_multiplicada + [multiplicacao_da_lista(lista_de_pares[i])]
+    for par in lista_de_pares:
+        lista_multiplicada.append(multiplicacao_da_lista(par))
 
     return lista_multiplicada
 
 
+# Listas com até esse tamanho são ordenadas por inserção, que é a mais
+# rápida para listas pequenas (como a parte N de uma mensagem, com até 10 números)
+LIMITE_DA_INSERCAO = 16
+
+
 def ordenar_lista(lista_original):
     """Cria uma versão ordenada de uma lista.
 
+    Escolhe o algoritmo de acordo com a lista:
+        - até LIMITE_DA_INSERCAO elementos: ordenação por inserção;
+        - números inteiros num intervalo pequeno (como os números < 500
+          da parte M): ordenação por contagem, que é linear;
+        - qualquer outra coisa: ordenação por intercalação (merge sort),
+          que é O(n log n) e estável.
+
     Args:
         lista_original (list): Lista a ser ordenada.
     Retorna:
         Uma cópia da lista_original, mas ordenada.
     """
-    # Implementação do GnomeSort, copiada da wikipedia
-    # veja: https://en.wikipedia.org/wiki/Gnome_sort
-    # veja: https://pt.wikipedia.org/wiki/Gnome_sort
-
     # Faça uma cópia para não modificar a lista original
     lista = list(lista_original)
-    pivot = 0
-    lista_length = len(lista)
-    while pivot < lista_length - 1:
-        if lista[pivot] > lista[pivot + 1]:
-            temp = lista[pivot + 1]
-            lista[pivot + 1] = lista[pivot]
-            lista[pivot] = temp
-            if pivot > 0:
-                pivot -= 2
-        pivot += 1
-    return lista
 
+    if len(lista) <= LIMITE_DA_INSERCAO:
+        ordenar_por_insercao(lista, 0, len(lista))
+        return lista
 
-def sequencia_A(quantidade):
-    """Gera uma lista com `quantidade` termos da sequencia 1, 2, 3, 4, 5..."""
-    sequencia = []
+    intervalo = intervalo_dos_inteiros(lista)
+    if intervalo != None and intervalo[1] - intervalo[0] <= 4 * len(lista):
+        return ordenar_por_contagem(lista, intervalo[0], intervalo[1])
+
+    return ordenar_por_intercalacao(lista)
+
+
+def ordenar_por_insercao(lista, inicio, fim):
+    """Ordena (modificando) o trecho lista[inicio:fim] por inserção."""
+    for i in range(inicio + 1, fim):
+        elemento = lista[i]
+        j = i - 1
+        while j >= inicio and lista[j] > elemento:
+            lista[j + 1] = lista[j]
+            j = j - 1
+        lista[j + 1] = elemento
+
+
+def intervalo_dos_inteiros(lista):
+    """Retorna [menor, maior] se todos os itens forem inteiros, senão None."""
+    menor = lista[0]
+    maior = lista[0]
+
+    for elemento in lista:
+        if type(elemento) != int:
+            return None
+        if elemento < menor:
+            menor = elemento
+        elif elemento > maior:
+            maior = elemento
+
+    return [menor, maior]
+
+
+def ordenar_por_contagem(lista, menor, maior):
+    """Cria uma versão ordenada de uma lista de inteiros entre menor e maior (inclusive).
+
+    Conta quantas vezes cada valor aparece e depois escreve os valores em
+    ordem, então o custo é O(n + (maior - menor)).
+    """
+    contagens = [0] * (maior - menor + 1)
+    for elemento in lista:
+        contagens[elemento - menor] += 1
+
+    ordenada = []
+    for deslocamento in range(0, len(contagens)):
+        if contagens[deslocamento] > 0:
+            ordenada.extend([menor + deslocamento] * contagens[deslocamento])
+
+    return ordenada
+
+
+def ordenar_por_intercalacao(lista):
+    """Cria uma versão ordenada de uma lista com merge sort de baixo para cima.
+
+    Como no TimSort, primeiro ordena blocos de LIMITE_DA_INSERCAO elementos
+    por inserção e depois intercala os blocos dois a dois, dobrando o tamanho
+    a cada rodada. Duas listas se revezam como origem e destino, então cada
+    rodada não aloca nada novo.
+    """
+    tamanho = len(lista)
+    origem = list(lista)
+
+    for inicio in range(0, tamanho, LIMITE_DA_INSERCAO):
+        ordenar_por_insercao(origem, inicio, min(inicio + LIMITE_DA_INSERCAO, tamanho))
+
+    destino = [None] * tamanho
+    largura = LIMITE_DA_INSERCAO
+    while largura < tamanho:
+        for inicio in range(0, tamanho, 2 * largura):
+            meio = min(inicio + largura, tamanho)
+            fim = min(inicio + 2 * largura, tamanho)
+            intercalar(origem, inicio, meio, fim, destino)
+        origem, destino = destino, origem
+        largura = largura * 2
+
+    return origem
+
+
+def intercalar(origem, inicio, meio, fim, destino):
+    """Intercala origem[inicio:meio] e origem[meio:fim] (já ordenados) em destino[inicio:fim]."""
+    i = inicio
+    j = meio
+    k = inicio
+
+    while i < meio and j < fim:
+        # "<=" mantém a ordenação estável: em caso de empate, o da esquerda vem antes
+        if origem[i] <= origem[j]:
+            destino[k] = origem[i]
+            i = i + 1
+        else:
+            destino[k] = origem[j]
+            j = j + 1
+        k = k + 1
+
+    # Só um dos dois lados pode ter sobrado
+    destino[k:k + meio - i] = origem[i:meio]
+    k = k + meio - i
+    destino[k:k + fim - j] = origem[j:fim]
+
+
+class CacheDeSequencia:
+    """Guarda os termos já calculados de uma sequência que nunca muda.
+
+    As sequências dos métodos A e B são sempre as mesmas, então não faz
+    sentido gerá-las de novo para cada mensagem: os termos ficam num
+    array de inteiros e cada pedido recebe um memoryview do começo dele
+    (um "prefixo"), sem copiar nada.
+
+    Atributos:
+        acertos (int): Pedidos atendidos com os termos que já existiam.
+        falhas (int): Pedidos que precisaram calcular termos novos.
+    """
+
+    def __init__(self, termo):
+        """`termo` é uma função que recebe o índice (0, 1, 2...) e retorna o termo."""
+        self.termo = termo
+        self.termos = array("q")
+        self.visao = memoryview(self.termos)
+        self.acertos = 0
+        self.falhas = 0
+
+    def prefixo(self, quantidade):
+        """Retorna um memoryview com os `quantidade` primeiros termos."""
+        if quantidade <= len(self.termos):
+            self.acertos = self.acertos + 1
+        else:
+            self.falhas = self.falhas + 1
+            self.crescer(quantidade)
+
+        return self.visao[:quantidade]
+
+    def crescer(self, quantidade):
+        """Calcula termos até ter pelo menos `quantidade` (dobrando o tamanho)."""
+        novo_tamanho = max(quantidade, 2 * len(self.termos), 16)
+
+        # Um array não pode mudar de tamanho enquanto existem memoryviews
+        # dele, então criamos um novo; os prefixos antigos continuam válidos.
+        termos = array("q", self.termos)
+        for indice in range(len(self.termos), novo_tamanho):
+            termos.append(self.termo(indice))
+
+        self.termos = termos
+        self.visao = memoryview(termos)
 
-    for numero in range(1, quantidade + 1):
-        sequencia = sequencia + [numero]
 
-    return sequencia
+# 1, 2, 3, 4, 5...
+SEQUENCIA_A = CacheDeSequencia(lambda indice: indice + 1)
 
+# 1, 2, 4, 7, 11... (cada termo soma o índice ao anterior: 1 + 0 + 1 + 2 + ...)
+SEQUENCIA_B = CacheDeSequencia(lambda indice: 1 + indice * (indice + 1) // 2)
+
+
+def sequencia_A(quantidade):
+    """Gera uma lista com `quantidade` termos da sequencia 1, 2, 3, 4, 5..."""
+    return SEQUENCIA_A.prefixo(quantidade).tolist()
 
-def metodo_A(lista_N):
+
+def metodo_A(lista_N, verboso=True):
     """Dada a lista de números N, calcula o dia e mês seguindo o método A.
 
     Args:
         lista_N (lista): Lista contendo a terceira parte da mensagem.
+        verboso (bool): Se False, não imprime os passos intermediários.
     Retorna:
         Uma lista no formato [dia, mes].
     """
-    sequencia = sequencia_A(len(lista_N))
+    sequencia = SEQUENCIA_A.prefixo(len(lista_N))
     ordenada = ordenar_lista(lista_N)
-    print("Lista ordenada: " + str(ordenada))
-
     pares = lista_dos_pares(ordenada, sequencia)
-    print("Multiplicação dos N números ordenados + serie: " + str(pares))
-
     produtos = produto_dos_pares(pares)
-    print("                                             = " + str(produtos))
-
     numero_S = soma_da_lista(produtos)
-    print("Soma dos produtos: " + str(numero_S))
+
+    if verboso:
+        print("Lista ordenada: " + str(ordenada))
+        print("Multiplicação dos N números ordenados + serie: " + str(pares))
+        print("                                             = " + str(produtos))
+        print("Soma dos produtos: " + str(numero_S))
 
     return [numero_S % 31, numero_S % 12]
 
 
 def sequencia_B(quantidade):
     """Gera uma lista com `quantidade` termos da sequencia 1, 2, 4, 7, 11..."""
-    sequencia = []
-
-    acumulador = 1
-    for passo in range(0, quantidade):
-        acumulador += passo
-        sequencia = sequencia + [acumulador]
-
-    return sequencia
+    return SEQUENCIA_B.prefixo(quantidade).tolist()
 
 
 def lista_dos_digitos(numero):
     """Transforma um número em uma lista de seus dígitos."""
-    lista = []
+    numero = int(numero)
+    blocos = []
 
-    while int(numero) > 0:
-        lista = lista + [int(numero) % 10]
-        numero = int(numero) // 10
+    while numero >= 10000:
+        numero, bloco = divmod(numero, 10000)
+        blocos.append(bloco)
 
-    # Os números serão decompostos em ordem reversa,
-    # então temos que inverter o resultado antes de entregá-lo
-    # a quem o pediu
-    return lista[::-1]
+    # O bloco mais à esquerda não tem zeros à esquerda
+    lista = ultimos_digitos(numero, 4)
+
+    # Os blocos foram decompostos em ordem reversa,
+    # então temos que percorrê-los do fim para o começo
+    for i in range(len(blocos) - 1, -1, -1):
+        lista.extend(DIGITOS_ATE_9999[blocos[i]])
+
+    return lista
 
 
 def soma_dos_pares(lista_de_pares):
@@ -310,8 +652,8 @@ def soma_dos_pares(lista_de_pares):
     """
     lista_somada = []
 
-    for i in range(0, len(lista_de_pares)):
-        lista_somada = lista_somada + [soma_da_lista(lista_de_pares[i])]
+    for par in lista_de_pares:
+        lista_somada.append(soma_da_lista(par))
 
     return lista_somada
 
@@ -334,66 +676,74 @@ def soma_das_sublistas(lista_com_sublistas):
 def dois_ultimos_digitos_de_cada_um(lista_de_numeros):
     lista_dos_ultimos_digitos = []
 
-    for i in range(0, len(lista_de_numeros)):
-        digitos = lista_dos_digitos(lista_de_numeros[i])
-
-        if len(digitos) >= 2:
-            ultimos_digitos = digitos[-2:]
-        else:
-            ultimos_digitos = digitos[-1:]
-
-        lista_dos_ultimos_digitos = lista_dos_ultimos_digitos + [ultimos_digitos]
+    for numero in lista_de_numeros:
+        lista_dos_ultimos_digitos.append(ultimos_digitos(numero, 2))
 
     return lista_dos_ultimos_digitos
 
 
-def metodo_B(lista_N):
+def metodo_B(lista_N, verboso=True):
     """Dada a lista de números N, calcula o dia e mês seguindo o método B.
 
     Args:
         lista_N (lista): Lista contendo a terceira parte da mensagem.
+        verboso (bool): Se False, não imprime os passos intermediários.
     Retorna:
         Uma lista no formato [dia, mes].
     """
-    sequencia = sequencia_B(len(lista_N))
+    sequencia = SEQUENCIA_B.prefixo(len(lista_N))
     pares = lista_dos_pares(lista_N, sequencia)
-    print("Soma dos N números + serie: " + str(pares))
-
     somados = soma_dos_pares(pares)
-    print("                          = " + str(somados))
+    somas_dos_digitos = somas_dos_ultimos_digitos(somados, 2)
+    numero_S = soma_da_lista(somas_dos_digitos)
 
-    ultimos_digitos = dois_ultimos_digitos_de_cada_um(somados)
-    print("Soma dos 2 últimos dígitos: " + str(ultimos_digitos))
+    if verboso:
+        print("Soma dos N números + serie: " + str(pares))
+        print("                          = " + str(somados))
+        print("Soma dos 2 últimos dígitos: " + str(dois_ultimos_digitos_de_cada_um(somados)))
+        print("                          = " + str(somas_dos_digitos))
+        print("                          = " + str(numero_S))
 
-    somados = soma_das_sublistas(ultimos_digitos)
-    print("                          = " + str(somados))
+    return [numero_S % 31, numero_S % 12]
 
-    numero_S = soma_da_lista(somados)
-    print("                          = " + str(numero_S))
 
-    return [numero_S % 31, numero_S % 12]
+MAXIMOS_POR_MES = [
+    31, # Dezembro
+    31, # Janeiro
+    28, # Fevereiro
+    31, # Março
+    30, # Abril
+    31, # Maio
+    30, # Junho
+    31, # Julho
+    31, # Agosto
+    30, # Setembro
+    31, # Outubro
+    30, # Novembro
+]
+
+NOMES_DOS_MESES = [
+    "dezembro",   # 0
+    "janeiro",    # 1
+    "fevereiro",  # 2
+    "março",      # 3
+    "abril",      # 4
+    "maio",       # 5
+    "junho",      # 6
+    "julho",      # 7
+    "agosto",     # 8
+    "setembro",   # 9
+    "outubro",    # 10
+    "novembro",   # 11
+]
 
 
 def corrigir_dia_e_mes(dia, mes):
-    maximos_por_mes = [
-        31, # Dezembro
-        31, # Janeiro
-        28, # Fevereiro
-        31, # Março
-        30, # Abril
-        31, # Maio
-        30, # Junho
-        31, # Julho
-        31, # Agosto
-        30, # Setembro
-        31, # Outubro
-        30, # Novembro
-    ]
-
-    if dia > maximos_por_mes[mes]:
+    if dia > MAXIMOS_POR_MES[mes]:
         # Dia pertence ao próximo mês
-        dia = dia - maximos_por_mes[mes]
-        mes = mes + 1
+        dia = dia - MAXIMOS_POR_MES[mes]
+        # Depois de novembro (11) vem dezembro, que é o mês 0
+        mes = (mes + 1) % 12
 
         # Verifica se por acaso a data precisa de mais correções
         return corrigir_dia_e_mes(dia, mes)
@@ -409,7 +759,7 @@ def corrigir_dia_e_mes(dia, mes):
         else:
             mes = mes - 1
 
-        dia = maximos_por_mes[mes]
+        dia = MAXIMOS_POR_MES[mes]
         # Verifica se por acaso a data precisa de mais correções
         return corrigir_dia_e_mes(dia, mes)
     else:
@@ -418,36 +768,64 @@ def corrigir_dia_e_mes(dia, mes):
 
 
 def dia_e_mes_para_string(dia, mes):
-    nomes_dos_meses = [
-        "dezembro",   # 0
-        "janeiro",    # 1
-        "fevereiro",  # 2
-        "março",      # 3
-        "abril",      # 4
-        "maio",       # 5
-        "junho",      # 6
-        "julho",      # 7
-        "agosto",     # 8
-        "setembro",   # 9
-        "outubro",    # 10
-        "novembro",   # 11
-    ]
-
-    return str(dia) + " de " + nomes_dos_meses[mes]
+    return str(dia) + " de " + NOMES_DOS_MESES[mes]
+
+
+def montar_tabela_de_datas():
+    """Calcula a data corrigida e o texto final para todo dia (0 a 30) e mes (0 a 11).
+
+    Os métodos A e B sempre dão dia = S % 31 e mes = S % 12, então só existem
+    31 x 12 = 372 combinações possíveis. Corrigimos cada uma uma vez só com a
+    corrigir_dia_e_mes e guardamos o resultado:
+    TABELA_DE_DATAS[dia][mes] = [dia corrigido, mes corrigido, texto].
+    """
+    tabela = []
+
+    for dia in range(0, 31):
+        linha = []
+        for mes in range(0, 12):
+            dia_mes = corrigir_dia_e_mes(dia, mes)
+            linha.append([dia_mes[0], dia_mes[1], dia_e_mes_para_string(dia_mes[0], dia_mes[1])])
+        tabela.append(linha)
+
+    return tabela
+
+
+TABELA_DE_DATAS = montar_tabela_de_datas()
+
+
+def data_corrigida(dia, mes):
+    """Retorna [dia corrigido, mes corrigido, texto] para o dia e mes de um método.
+
+    É uma consulta à TABELA_DE_DATAS; fora dela (o que os métodos nunca
+    geram), calcula com corrigir_dia_e_mes e dia_e_mes_para_string.
+    """
+    if 0 <= dia < 31 and 0 <= mes < 12:
+        return TABELA_DE_DATAS[dia][mes]
+
+    dia_mes = corrigir_dia_e_mes(dia, mes)
+    return [dia_mes[0], dia_mes[1], dia_e_mes_para_string(dia_mes[0], dia_mes[1])]
 
 # ⭕⭕  ⭕⭕  ⭕⭕
 # --- AQUI COMEÇA O FLUXO PRINCIPAL DO PROGRAMA ---
 
-def resolucao(entrada):
+# Com interativo=False, uma mensagem inválida não faz a resolucao pedir outra
+# ao usuário (o que travaria uma execução sem ninguém olhando): ela só
+# retorna o ErroDeValidacao.
+def resolucao(entrada, interativo=True):
     codigo = pedir_numeros_para_o_usuario(entrada)
-    while partes_decodificadas(codigo) == None:
+    partes = partes_decodificadas(codigo)
+    while isinstance(partes, ErroDeValidacao):
+        if not interativo:
+            return partes
         print("Digite o código novamente pois deu algum erro no que você digitou.")
         codigo = pedir_numeros_para_o_usuario("")
+        partes = partes_decodificadas(codigo)
 
     print("O código é: " + str(codigo))
 
-    segunda_parte = partes_decodificadas(codigo)[0]
-    terceira_parte = partes_decodificadas(codigo)[1]
+    segunda_parte = partes[0]
+    terceira_parte = partes[1]
 
     print("A segunda parte é: " + str(segunda_parte))
     print("A terceira parte é: " + str(terceira_parte))
@@ -467,19 +845,431 @@ def resolucao(entrada):
         print("Usaremos o método B.")
         dia_mes = metodo_B(terceira_parte)
 
-    dia = dia_mes[0]
-    mes = dia_mes[1]
-
-    dia_mes_corrigidos = corrigir_dia_e_mes(dia, mes)
-    dia = dia_mes_corrigidos[0]
-    mes = dia_mes_corrigidos[1]
-
-    data = dia_e_mes_para_string(dia, mes)
+    data = data_corrigida(dia_mes[0], dia_mes[1])[2]
     print("Resp.: " + data)
 
     return data
 
 
+# ⭕⭕  ⭕⭕  ⭕⭕
+# --- MODO EM LOTE ---
+#
+# A resolucao() acima é pensada para uma pessoa digitando uma mensagem por vez:
+# ela imprime cada passo e pede a mensagem de novo quando algo dá errado.
+# As funções abaixo fazem a mesma conta sem imprimir nada, para decodificar
+# muitas mensagens de uma vez (por exemplo, um arquivo com uma mensagem por linha).
+
+def decodificar_mensagem(codigo):
+    """Decodifica uma mensagem (já convertida em números) sem imprimir nada.
+
+    Calcula o número S com os laços escritos aqui mesmo, em vez de chamar
+    metodo_A e metodo_B: este é o caminho quente do modo em lote, e passar
+    cada número por lista_dos_pares, produto_dos_pares e soma_da_lista
+    custava mais que a conta em si.
+
+    Args:
+        codigo (list): Lista de números da mensagem, como a devolvida por
+            converter_para_numeros.
+    Retorna:
+        Um registro no formato [metodo, dia, mes, data], onde metodo é "A"
+        ou "B" e data é a string final (ex: "12 de julho"). Se a mensagem
+        for inválida, retorna o ErroDeValidacao dela.
+    """
+    partes = partes_decodificadas(codigo, verboso=False)
+    if isinstance(partes, ErroDeValidacao):
+        return partes
+
+    metodo = escolher_metodo(partes[0])
+
+    # partes[1] é uma fatia nova do codigo, então pode ser ordenada no lugar
+    lista_N = partes[1]
+    quantidade = len(lista_N)
+    numero_S = 0
+
+    if metodo == "A":
+        sequencia = SEQUENCIA_A.prefixo(quantidade)
+        ordenar_por_insercao(lista_N, 0, quantidade)
+        for i in range(0, quantidade):
+            numero_S = numero_S + lista_N[i] * sequencia[i]
+    else:
+        sequencia = SEQUENCIA_B.prefixo(quantidade)
+        for i in range(0, quantidade):
+            somado = lista_N[i] + sequencia[i]
+            if somado > 0:
+                numero_S = numero_S + SOMA_DOS_DIGITOS_ATE_9999[somado % 100]
+
+    data = TABELA_DE_DATAS[numero_S % 31][numero_S % 12]
+    return [metodo, data[0], data[1], data[2]]
+
+
+def escolher_metodo(segunda_parte):
+    """Retorna "A" se a soma dos dígitos da soma dos M números for par, senão "B"."""
+    soma = 0
+    for numero in segunda_parte:
+        soma = soma + numero
+
+    # A soma de até 5 números menores que 500 sempre está na tabela
+    if 0 <= soma < 10000:
+        somador = SOMA_DOS_DIGITOS_ATE_9999[soma]
+    else:
+        somador = soma_dos_digitos(soma)
+
+    if se_par(somador):
+        return "A"
+    return "B"
+
+
+def registro_da_data(metodo, dia, mes):
+    """Corrige o dia e mês calculados por um método e monta o registro da mensagem."""
+    data = data_corrigida(dia, mes)
+    return [metodo, data[0], data[1], data[2]]
+
+
+def resolucao_em_lote(mensagens):
+    """Decodifica cada mensagem de `mensagens`, gerando um registro por mensagem.
+
+    Args:
+        mensagens (iterável): Mensagens como str ou bytes (no mesmo formato
+            aceito pela resolucao) ou como listas de números já convertidas.
+    Gera:
+        Um registro (ou ErroDeValidacao) de decodificar_mensagem para cada
+        mensagem, na mesma ordem da entrada.
+    """
+    for mensagem in mensagens:
+        if isinstance(mensagem, (str, bytes)):
+            mensagem = converter_para_numeros(mensagem)
+        yield decodificar_mensagem(mensagem)
+
+
+# ⭕⭕  ⭕⭕  ⭕⭕
+# --- MODO EM LOTE COM NUMPY ---
+#
+# Com o NumPy instalado, as partes N de mesmo tamanho (e mesmo método) são
+# empilhadas numa matriz, uma mensagem por linha, e os métodos A e B viram
+# algumas operações sobre a matriz inteira em vez de um laço por mensagem.
+
+# Maior valor que deixamos entrar numa matriz de int64: acima disso (ou com
+# números negativos) a mensagem é calculada pelo caminho em Python puro
+LIMITE_DO_NUMPY = 2 ** 62
+
+
+def somas_em_lote_numpy(partes_N, metodo):
+    """Calcula o número S do `metodo` ("A" ou "B") para partes N de mesmo tamanho.
+
+    Args:
+        partes_N (list): Partes N, todas com o mesmo tamanho (maior que 0).
+        metodo (str): "A" ou "B".
+    Retorna:
+        Uma lista com o número S de cada parte, ou None se algum número não
+        couber com segurança num int64.
+    """
+    tamanho = len(partes_N[0])
+    try:
+        matriz = numpy.array(partes_N, dtype=numpy.int64)
+    except OverflowError:
+        return None
+    if matriz.min() < 0 or int(matriz.max()) * tamanho * tamanho >= LIMITE_DO_NUMPY:
+        return None
+
+    if metodo == "A":
+        # Ordena cada linha e multiplica pela série 1, 2, 3... (produto matricial)
+        pesos = numpy.arange(1, tamanho + 1, dtype=numpy.int64)
+        somas = numpy.sort(matriz, axis=1) @ pesos
+    else:
+        # Soma a série 1, 2, 4, 7... e depois os dois últimos dígitos de cada número
+        somados = matriz + numpy.frombuffer(SEQUENCIA_B.prefixo(tamanho), dtype=numpy.int64)
+        somas = somas_dos_ultimos_digitos(somados, 2).sum(axis=1)
+
+    return somas.tolist()
+
+
+def dias_e_meses_em_lote(partes_N, metodos):
+    """Calcula [dia, mes] de várias mensagens de uma vez com o NumPy.
+
+    Dá exatamente o mesmo resultado que chamar metodo_A/metodo_B em cada parte.
+
+    Args:
+        partes_N (list): A terceira parte de cada mensagem.
+        metodos (list): O método ("A" ou "B") de cada mensagem.
+    Retorna:
+        Uma lista com um [dia, mes] para cada mensagem, na mesma ordem.
+    """
+    # Agrupa as mensagens por método e tamanho: cada grupo vira uma matriz
+    grupos = {}
+    for indice in range(0, len(partes_N)):
+        chave = (metodos[indice], len(partes_N[indice]))
+        if chave in grupos:
+            grupos[chave].append(indice)
+        else:
+            grupos[chave] = [indice]
+
+    dias_e_meses = [None] * len(partes_N)
+    for (metodo, tamanho), indices in grupos.items():
+        partes = [partes_N[indice] for indice in indices]
+
+        if tamanho == 0:
+            somas = [0] * len(indices)
+        else:
+            somas = somas_em_lote_numpy(partes, metodo)
+
+        if somas == None:
+            # Números grandes demais (ou negativos): usa o caminho em Python puro
+            for indice in indices:
+                if metodo == "A":
+                    dias_e_meses[indice] = metodo_A(partes_N[indice], verboso=False)
+                else:
+                    dias_e_meses[indice] = metodo_B(partes_N[indice], verboso=False)
+            continue
+
+        for i in range(0, len(indices)):
+            dias_e_meses[indices[i]] = [somas[i] % 31, somas[i] % 12]
+
+    return dias_e_meses
+
+
+def resolucao_em_lote_numpy(mensagens, tamanho_do_bloco=100000):
+    """Igual a resolucao_em_lote, mas calcula os métodos A e B com o NumPy.
+
+    As mensagens são lidas em blocos de `tamanho_do_bloco`, então a memória
+    usada não depende de quantas mensagens existem no total.
+    """
+    if numpy is None:
+        raise RuntimeError("O modo em lote com NumPy precisa do NumPy instalado.")
+
+    bloco = []
+    for mensagem in mensagens:
+        bloco.append(mensagem)
+        if len(bloco) == tamanho_do_bloco:
+            yield from decodificar_bloco_numpy(bloco)
+            bloco = []
+
+    if bloco != []:
+        yield from decodificar_bloco_numpy(bloco)
+
+
+def decodificar_bloco_numpy(mensagens):
+    """Decodifica um bloco de mensagens, retornando um registro (ou ErroDeValidacao) por mensagem."""
+    registros = [None] * len(mensagens)
+    validas = []
+    partes_N = []
+    metodos = []
+
+    for indice in range(0, len(mensagens)):
+        codigo = mensagens[indice]
+        if isinstance(codigo, (str, bytes)):
+            codigo = converter_para_numeros(codigo)
+
+        partes = partes_decodificadas(codigo, verboso=False)
+        if isinstance(partes, ErroDeValidacao):
+            registros[indice] = partes
+        else:
+            validas.append(indice)
+            partes_N.append(partes[1])
+            metodos.append(escolher_metodo(partes[0]))
+
+    dias_e_meses = dias_e_meses_em_lote(partes_N, metodos)
+    for i in range(0, len(validas)):
+        registros[validas[i]] = registro_da_data(metodos[i], dias_e_meses[i][0], dias_e_meses[i][1])
+
+    return registros
+
+
+def registro_para_linha(registro):
+    """Formata um registro de decodificar_mensagem como uma linha de saída."""
+    if isinstance(registro, ErroDeValidacao):
+        return "-\tINVALIDA\t" + registro.motivo + "\n"
+    return registro[0] + "\t" + registro[3] + "\n"
+
+
+def rejeicao_para_linha(linha, deslocamento, erro):
+    """Formata uma mensagem rejeitada para o arquivo de rejeitadas.
+
+    O formato é "deslocamento<TAB>posição<TAB>motivo<TAB>mensagem original",
+    onde deslocamento é a posição (em bytes) da mensagem no arquivo de
+    entrada e posição é o índice do número que causou o erro.
+    """
+    return b"%d\t%d\t%s\t%s\n" % (deslocamento, erro.posicao, erro.motivo.encode("ascii"), linha)
+
+
+def decodificar_linhas(linhas, deslocamento, usar_numpy=False):
+    """Decodifica uma lista de linhas (bytes, sem o "\\n") de um arquivo de mensagens.
+
+    Args:
+        linhas (list): As mensagens, uma por linha, sem a quebra de linha.
+        deslocamento (int): Posição em bytes da primeira linha no arquivo.
+        usar_numpy (bool): Se deve usar o backend do NumPy.
+    Retorna:
+        [saida, rejeitadas, invalidas]: o texto com um registro por linha,
+        as linhas do arquivo de rejeitadas (bytes) e quantas eram inválidas.
+    """
+    if usar_numpy:
+        registros = resolucao_em_lote_numpy(linhas)
+    else:
+        registros = resolucao_em_lote(linhas)
+
+    saida = []
+    rejeitadas = []
+    indice = 0
+    for registro in registros:
+        saida.append(registro_para_linha(registro))
+        if isinstance(registro, ErroDeValidacao):
+            rejeitadas.append(rejeicao_para_linha(linhas[indice], deslocamento, registro))
+        # Cada linha ocupa seu tamanho mais o "\n"
+        deslocamento = deslocamento + len(linhas[indice]) + 1
+        indice = indice + 1
+
+    return ["".join(saida), b"".join(rejeitadas), len(rejeitadas)]
+
+
+def resolver_arquivo(entrada, saida, usar_numpy=False, rejeitadas=None, linhas_por_bloco=10000):
+    """Lê uma mensagem por linha de `entrada` e escreve um registro por linha em `saida`.
+
+    Mensagens inválidas também geram uma linha em `saida` (para a saída
+    continuar alinhada com a entrada) e, se `rejeitadas` for dado, uma
+    linha nesse arquivo binário dizendo onde e por que a mensagem foi rejeitada.
+
+    Args:
+        entrada: Arquivo aberto em modo binário (ou uma lista de linhas bytes).
+        saida: Arquivo de texto para os registros.
+        usar_numpy (bool): Se deve usar o backend do NumPy.
+        rejeitadas: Arquivo binário para as mensagens rejeitadas, ou None.
+        linhas_por_bloco (int): Quantas linhas decodificar de cada vez.
+    Retorna:
+        [total, invalidas]: quantas mensagens foram lidas e quantas eram inválidas.
+    """
+    total = 0
+    invalidas = 0
+    deslocamento = 0
+
+    for bloco in blocos_de_linhas(entrada, linhas_por_bloco):
+        resultado = decodificar_linhas(bloco, deslocamento, usar_numpy)
+        saida.write(resultado[0])
+        if rejeitadas != None:
+            rejeitadas.write(resultado[1])
+
+        total = total + len(bloco)
+        invalidas = invalidas + resultado[2]
+        for linha in bloco:
+            deslocamento = deslocamento + len(linha) + 1
+
+    return [total, invalidas]
+
+
+def blocos_de_linhas(entrada, linhas_por_bloco):
+    """Agrupa as linhas de `entrada` em listas de até `linhas_por_bloco` linhas sem o "\\n"."""
+    bloco = []
+
+    for linha in entrada:
+        if linha.endswith(b"\n"):
+            linha = linha[:-1]
+        bloco.append(linha)
+
+        if len(bloco) == linhas_por_bloco:
+            yield bloco
+            bloco = []
+
+    if bloco != []:
+        yield bloco
+
+
+# ⭕⭕  ⭕⭕  ⭕⭕
+# --- MODO EM LOTE COM VÁRIOS PROCESSOS ---
+#
+# Para arquivos enormes, o arquivo é mapeado na memória (mmap) e dividido em
+# fatias que sempre terminam no fim de uma linha. Cada processo decodifica
+# fatias inteiras com as mesmas funções do modo em lote, e os resultados são
+# escritos na ordem das fatias, ou seja, na mesma ordem das mensagens.
+
+def fatias_do_arquivo(caminho, tamanho_da_fatia):
+    """Divide um arquivo em fatias de ~`tamanho_da_fatia` bytes alinhadas às linhas.
+
+    Retorna:
+        Uma lista de pares [inicio, fim] (em bytes, fim não incluso). Cada
+        fatia termina logo depois de um "\n" (ou no fim do arquivo).
+    """
+    fatias = []
+
+    with open(caminho, "rb") as arquivo:
+        tamanho = os.fstat(arquivo.fileno()).st_size
+        if tamanho == 0:
+            # Não dá para mapear um arquivo vazio
+            return fatias
+
+        with mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            inicio = 0
+            while inicio < tamanho:
+                fim = inicio + tamanho_da_fatia
+                if fim >= tamanho:
+                    fim = tamanho
+                else:
+                    # Avança até o fim da linha em que a fatia cortou
+                    quebra = mapa.find(b"\n", fim - 1)
+                    if quebra == -1:
+                        fim = tamanho
+                    else:
+                        fim = quebra + 1
+
+                fatias.append([inicio, fim])
+                inicio = fim
+
+    return fatias
+
+
+def decodificar_fatia(tarefa):
+    """Decodifica as linhas de uma fatia do arquivo (roda dentro de um processo do pool).
+
+    Args:
+        tarefa (list): [caminho, inicio, fim, usar_numpy].
+    Retorna:
+        [saida, rejeitadas, invalidas, total], como na decodificar_linhas,
+        mais a quantidade de mensagens na fatia.
+    """
+    caminho, inicio, fim, usar_numpy = tarefa
+
+    with open(caminho, "rb") as arquivo:
+        with mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            linhas = mapa[inicio:fim].split(b"\n")
+
+    # A fatia termina com "\n", o que deixa um pedaço vazio no final que não é uma mensagem
+    if linhas[-1] == b"":
+        linhas.pop()
+
+    return decodificar_linhas(linhas, inicio, usar_numpy) + [len(linhas)]
+
+
+def resolver_arquivo_em_paralelo(caminho, saida, processos=None,
+                                 tamanho_da_fatia=1 << 22, usar_numpy=False, rejeitadas=None):
+    """Decodifica um arquivo com uma mensagem por linha usando vários processos.
+
+    Args:
+        caminho (str): Arquivo de entrada (precisa ser um arquivo de verdade,
+            não stdin, para poder ser mapeado).
+        saida: Arquivo de texto onde escrever um registro por linha, na
+            mesma ordem das mensagens.
+        processos (int): Quantos processos usar (None = um por CPU).
+        tamanho_da_fatia (int): Tamanho aproximado, em bytes, de cada fatia.
+        usar_numpy (bool): Se cada processo deve usar o backend do NumPy.
+        rejeitadas: Arquivo binário para as mensagens rejeitadas, ou None.
+    Retorna:
+        [total, invalidas], como na resolver_arquivo.
+    """
+    tarefas = []
+    for inicio, fim in fatias_do_arquivo(caminho, tamanho_da_fatia):
+        tarefas.append([caminho, inicio, fim, usar_numpy])
+
+    total = 0
+    invalidas = 0
+    with multiprocessing.Pool(processos) as pool:
+        # imap (e não imap_unordered) devolve os resultados na ordem das fatias
+        for resultado in pool.imap(decodificar_fatia, tarefas):
+            saida.write(resultado[0])
+            if rejeitadas != None:
+                rejeitadas.write(resultado[1])
+            invalidas = invalidas + resultado[2]
+            total = total + resultado[3]
+
+    return [total, invalidas]
+
 
 testes = [
     "3 4 50 2 13 67 4 23 18",
@@ -487,7 +1277,71 @@ testes = [
     "5, 6, 22, 123, 34, 67, 89, 32, 189, 25, 53, 67, 125.",
 ]
 
-for entrada in testes:
-    print("\n\n")
-    resolucao(entrada)
-    print("\n\n----------\n\n")
+
+def gerar_mensagens(quantidade, semente=0):
+    """Gera `quantidade` mensagens válidas aleatórias no formato dos testes."""
+    gerador = random.Random(semente)
+    mensagens = []
+
+    for i in range(0, quantidade):
+        numero_M = gerador.randint(0, 5)
+        numero_N = gerador.randint(0, 10)
+        numeros = [numero_M, numero_N]
+        for j in range(0, numero_M):
+            numeros.append(gerador.randint(0, 499))
+        for j in range(0, numero_N):
+            numeros.append(gerador.randint(0, 999))
+        mensagens.append(", ".join([str(numero) for numero in numeros]) + ".")
+
+    return mensagens
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decodifica as mensagens da lista de exercícios INVASÃO de ALP.")
+    parser.add_argument("--lote", metavar="ARQUIVO",
+                        help="decodifica uma mensagem por linha de ARQUIVO ('-' para stdin)")
+    parser.add_argument("--saida", metavar="ARQUIVO", default="-",
+                        help="onde escrever os registros do modo em lote ('-' para stdout)")
+    parser.add_argument("--rejeitadas", metavar="ARQUIVO",
+                        help="no modo em lote, escreve em ARQUIVO onde e por que cada mensagem inválida foi rejeitada")
+    parser.add_argument("--processos", metavar="N", type=int,
+                        help="no modo em lote, decodifica o arquivo com N processos (0 = um por CPU)")
+    parser.add_argument("--tamanho-da-fatia", metavar="BYTES", type=int, default=1 << 22,
+                        help="tamanho aproximado de cada fatia do arquivo com --processos")
+    parser.add_argument("--numpy", action="store_true",
+                        help="no modo em lote, calcula os métodos A e B com o NumPy")
+    opcoes = parser.parse_args()
+
+    if opcoes.numpy and numpy is None:
+        parser.error("--numpy precisa do NumPy instalado")
+    if opcoes.processos is not None and opcoes.lote == "-":
+        parser.error("--processos precisa de um arquivo de verdade em --lote, não stdin")
+
+    if opcoes.lote is not None:
+        saida = sys.stdout if opcoes.saida == "-" else open(opcoes.saida, "w", encoding="utf-8")
+        rejeitadas = None if opcoes.rejeitadas is None else open(opcoes.rejeitadas, "wb")
+
+        if opcoes.processos is not None:
+            contagem = resolver_arquivo_em_paralelo(opcoes.lote, saida, opcoes.processos or None,
+                                                    opcoes.tamanho_da_fatia, opcoes.numpy, rejeitadas)
+        else:
+            entrada = sys.stdin.buffer if opcoes.lote == "-" else open(opcoes.lote, "rb")
+            with entrada:
+                contagem = resolver_arquivo(entrada, saida, opcoes.numpy, rejeitadas)
+
+        if saida is not sys.stdout:
+            saida.close()
+        if rejeitadas is not None:
+            rejeitadas.close()
+
+        print("Mensagens: %d, inválidas: %d" % (contagem[0], contagem[1]), file=sys.stderr)
+    else:
+        for entrada in testes:
+            print("\n\n")
+            resolucao(entrada)
+            print("\n\n----------\n\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,8 +17,18 @@ import ast
 import symtable
 from glob import glob
 from optparse import OptionParser  # TODO: migrate to argparse
+import os
 import os.path
 import re
+import time
+import multiprocessing
+import hashlib
+import pickle
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
 #import math
 
 # TODO: split to modules (at least the color stuff)
@@ -34,10 +44,15 @@ class MsgLevel:
     INFO    = 2
     DEBUG   = 3
 
+# Messages are formatted lazily: message("Use from %s to %s", a, b, level=...)
+# formats (and so repr()s a and b) only if the level is enabled. Where even
+# computing the arguments would cost something, guard the call with
+# "if verbosity >= level:", which is all that's left at the default verbosity.
+#
 verbosity = MsgLevel.WARNING
-def message(msg, level):
+def message(msg, *args, level):
     if level <= verbosity:
-        print(msg, file=sys.stderr)
+        print(msg % args if args else msg, file=sys.stderr)
 
 def format_alias(x):
     """Return human-readable description of an ast.alias (used in Import and ImportFrom nodes)."""
@@ -178,6 +193,11 @@ def htmlize_rgb(R,G,B,A=None):
 #
 # Namespaces also get a Node (with no associated AST node).
 #
+# Nodes don't keep their AST node (so that the AST of each file can be freed
+# once it has been analyzed), only its source location and its id in the
+# CallGraphVisitor (see CallGraphVisitor.get_ast_id()). There may be a lot of
+# Nodes, so they use __slots__, and their names are interned.
+#
 # Note the use of the term "node" for two different concepts:
 #  - this Node class
 #  - AST nodes (the "node" argument of CallGraphVisitor.visit_*())
@@ -189,11 +209,16 @@ class Node:
     node.  The meaning of this is that a use-edge to an unknown node is created
     when the analysis cannot determine which actual node is being used."""
 
-    def __init__(self, namespace, name, ast_node):
-        self.namespace = namespace
-        self.name = name
+    __slots__ = ('namespace', 'name', 'defined', 'ast_id', 'file_id', 'lineno', 'col_offset')
+
+    def __init__(self, namespace, name, ast_id=None, file_id=None, lineno=None, col_offset=None):
+        self.namespace = sys.intern(namespace) if isinstance(namespace, str) else namespace
+        self.name = sys.intern(name) if isinstance(name, str) else name  # None for "from . import x"
         self.defined = namespace is None  # assume that unknown nodes are defined
-        self.ast_node = ast_node
+        self.ast_id = ast_id  # None if there is no associated AST node
+        self.file_id = file_id
+        self.lineno = lineno
+        self.col_offset = col_offset
 
     def get_short_name(self):
         """Return the short name (i.e. excluding the namespace), of this Node.
@@ -210,8 +235,8 @@ class Node:
         if self.namespace is None:
             return '*.' + self.name
         else:
-            if self.get_level() >= 1 and self.ast_node is not None:
-                return "%s\\n(%s.py:%d)" % (self.name, self.namespace.split('.',1)[0], self.ast_node.lineno)
+            if self.get_level() >= 1 and self.ast_id is not None:
+                return "%s\\n(%s.py:%d)" % (self.name, self.namespace.split('.',1)[0], self.lineno)
             else:
                 return self.name
 
@@ -276,6 +301,154 @@ class Scope:
     def __repr__(self):
         return "<Scope: %s %s>" % (self.type, self.name)
 
+# Stand-in for an AST node of a file whose analysis was replayed from the cache.
+#
+# Nodes only use the source location of their AST node, and its identity
+# (see CallGraphVisitor.get_ast_id()), so that is all we need.
+#
+class CachedAstNode:
+    __slots__ = ('lineno', 'col_offset')
+
+    def __init__(self, lineno, col_offset):
+        self.lineno = lineno
+        self.col_offset = col_offset
+
+    def __repr__(self):
+        return "<CachedAstNode line %s col %s>" % (self.lineno, self.col_offset)
+
+class FileFacts:
+    """A record of everything that analyzing one file did to a CallGraphVisitor.
+
+    Analyzing a file only ever creates nodes (get_node()) and adds edges
+    (add_defines_edge(), add_uses_edge()). What it does depends on the file
+    itself, plus exactly two kinds of lookups into state shared with other
+    files: the namespace recorded for the AST node of an attribute's object
+    (in visit_Attribute()), and the full module name of an import (from
+    module_names). We record those lookups along with their results.
+
+    Replaying the recorded operations is equivalent to analyzing the file
+    again, provided every recorded lookup still gives the same result in the
+    visitor it is replayed into (see CallGraphVisitor.facts_valid()).
+
+    The recorded operations, in order, are:
+        ('n', namespace, name, ast_index)   get_node()
+        ('d', ns1, name1, ns2, name2)       add_defines_edge()
+        ('u', ns1, name1, ns2, name2)       add_uses_edge()
+        ('a', namespace, name, result)      namespace lookup for a Node's AST node
+        ('m', name, result)                 module_names lookup
+    where ast_index indexes into a list of source locations (-1 for no AST node)."""
+
+    def __init__(self):
+        self.ops = []
+        self.locations = []    # (line, column) of each AST node referenced by the ops
+        self.ast_index = {}    # id(AST node): index into self.locations
+        self.seen_nodes = set()
+        self.seen_edges = set()
+
+    def node(self, namespace, name, ast_node):
+        # only the first get_node() of a name can create it; later ones are no-ops
+        if (namespace, name) in self.seen_nodes:
+            return
+        self.seen_nodes.add((namespace, name))
+
+        if ast_node is None:
+            idx = -1
+        elif id(ast_node) in self.ast_index:
+            idx = self.ast_index[id(ast_node)]
+        else:
+            idx = len(self.locations)
+            self.ast_index[id(ast_node)] = idx
+            self.locations.append((getattr(ast_node, 'lineno', None), getattr(ast_node, 'col_offset', None)))
+        self.ops.append(('n', namespace, name, idx))
+
+    def edge(self, kind, from_node, to_node):
+        op = (kind, from_node.namespace, from_node.name, to_node.namespace, to_node.name)
+        if op not in self.seen_edges:
+            self.seen_edges.add(op)
+            self.ops.append(op)
+
+    def namespace_lookup(self, node, result):
+        self.ops.append(('a', node.namespace, node.name, result))
+
+    def module_lookup(self, name, result):
+        self.ops.append(('m', name, result))
+
+    def to_data(self, seconds):
+        """Return the facts as plain data (safe to pickle regardless of how pyan was imported)."""
+        return {'ops': self.ops, 'locations': self.locations, 'seconds': seconds}
+
+class FactCache:
+    """On-disk cache of FileFacts, keyed by a hash of the file content, its
+    module name, the Python version and the cache format.
+
+    Each entry is one file in the cache directory. Entries are touched when
+    used, and evict() removes the least recently used ones until the total
+    size is below max_bytes."""
+
+    FORMAT = 2  # bump when FileFacts changes
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0  # found, but not valid in the current visitor
+        self.seconds_saved = 0.0
+
+    def key(self, content, module_name):
+        h = hashlib.sha256()
+        h.update(("pyan-facts %d %s %s\0" % (self.FORMAT, sys.version, module_name)).encode("utf-8"))
+        h.update(content.encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".facts")
+
+    def load(self, key):
+        """Return the cached facts data for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path)  # mark as recently used
+        return data
+
+    def store(self, key, data):
+        path = self._path(key)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".facts"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            message("Evicted %s from cache", path, level=MsgLevel.INFO)
+
+    def get_stats(self):
+        """Return a human-readable summary of the cache statistics."""
+        lookups = self.hits + self.misses + self.rejected
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return "cache: %d hits, %d misses, %d rejected (%.1f%% hit rate), %.3f s saved" % (self.hits, self.misses, self.rejected, rate, self.seconds_saved)
+
 # The visitor has been converted by comparing these tables in Python docs:
 #
 # https://docs.python.org/2/library/compiler.html#module-compiler.ast
@@ -298,32 +471,219 @@ class CallGraphVisitor(ast.NodeVisitor):
             short_name = mod_name.rsplit('.', 1)[-1]
             self.module_names[short_name] = mod_name
         self.filenames = filenames
+        self.file_ids = {filename: i for i, filename in enumerate(filenames)}
+
+        # optional FactCache, and the FileFacts being recorded for the current file
+        self.cache = None
+        self.facts = None
 
         # data gathered from analysis
-        self.defines_edges = {}
-        self.uses_edges = {}
+        #
+        # The edges from each Node are stored as the keys of a dict (with values
+        # None), which works as an insertion-ordered set. This makes the output
+        # deterministic, and the same regardless of how the files were processed.
+        #
+        self.defines_edges = {}  # Node: {Node: None}
+        self.uses_edges = {}     # Node: {Node: None}
         self.nodes = {}   # Node name: list of Node objects (in possibly different namespaces)
+        self.node_index = {}  # (namespace, name): Node object
         self.scopes = {}  # fully qualified name of namespace: Scope object
-        self.ast_node_to_namespace = {}  # AST node: fully qualified name of namespace
+        self.ast_node_to_namespace = {}  # AST node id: fully qualified name of namespace
+        self.ast_ids = {}  # id(AST node): AST node id, for the file being analyzed
+        self.next_ast_id = 0
 
         # current context for analysis
         self.module_name = None
+        self.file_id = None
         self.name_stack  = []  # for building namespace name, node naming
         self.scope_stack = []  # the Scope objects
         self.class_stack = []  # for resolving "self"
         self.last_value  = None
 
-    def process(self, filename):
-        """Analyze the specified Python source file."""
+    def process_files(self, filenames, jobs=1, record=False):
+        """Analyze the specified Python source files, in order.
+
+        With jobs > 1, the files are first analyzed in parallel, each in a
+        worker process on a fresh CallGraphVisitor (see record_file()). The
+        facts recorded by the workers are then merged into this visitor by
+        replaying them in the original order of the files, which gives the
+        same result as analyzing the files here one by one.
+
+        Return a dict of filename: facts data (see process())."""
+
+        all_facts = {}
+        if jobs <= 1 or len(filenames) <= 1:
+            for filename in filenames:
+                message("========== processing file '%s' ==========", filename, level=MsgLevel.INFO)
+                all_facts[filename] = self.process(filename, record=record)
+            return all_facts
+
+        tasks = [(self.filenames, filename, self.cache) for filename in filenames]
+        with multiprocessing.Pool(min(jobs, len(filenames))) as pool:
+            for filename, (facts, cached) in zip(filenames, pool.imap(record_file, tasks)):
+                message("========== merging file '%s' ==========", filename, level=MsgLevel.INFO)
+                all_facts[filename] = self.process(filename, facts, cached, record=record)
+        return all_facts
+
+    def process(self, filename, facts=None, cached=False, record=False):
+        """Analyze the specified Python source file.
+
+        If facts data for the file is given (see record()), it is replayed
+        instead of analyzing the file again, if it is valid here. cached tells
+        whether the facts came from the cache.
+
+        Return the facts data of the file, if they were replayed or recorded
+        (always the case when record is true), else None."""
 
         if filename not in self.filenames:
             raise ValueError("Filename '%s' has not been preprocessed (was not given to __init__, which got %s)" % (filename, self.filenames))
-        with open(filename, "rt", encoding="utf-8") as f:
-            content = f.read()
         self.module_name = get_module_name(filename)
+        self.file_id = self.file_ids[filename]
+
+        content = None
+        key = None
+        if self.cache is not None:
+            content = self.read(filename)
+            key = self.cache.key(content, self.module_name)
+            if facts is None:
+                facts = self.cache.load(key)
+                cached = facts is not None
+            if not cached:
+                self.cache.misses += 1
+
+        if facts is not None:
+            start = time.perf_counter()
+            if self.replay(facts):
+                if cached:
+                    self.cache.hits += 1
+                    self.cache.seconds_saved += facts['seconds'] - (time.perf_counter() - start)
+                message("Replayed '%s'%s", filename, " from cache" if cached else "", level=MsgLevel.INFO)
+                self.module_name = None
+                return facts
+            if cached:
+                self.cache.rejected += 1
+
+        if content is None:
+            content = self.read(filename)
+        if key is not None or record:
+            self.facts = FileFacts()
+        data = self.analyze(content, filename)
+        if key is not None:
+            self.cache.store(key, data)
+        self.facts = None
+        self.module_name = None
+        return data
+
+    def record(self, filename):
+        """Analyze the specified Python source file, recording what it does.
+
+        Return a tuple (facts data, cached), where cached tells whether the
+        facts were found in the cache instead. Used by the workers in parallel
+        mode, each on a fresh CallGraphVisitor."""
+
+        self.module_name = get_module_name(filename)
+        self.file_id = self.file_ids[filename]
+        content = self.read(filename)
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(content, self.module_name)
+            data = self.cache.load(key)
+            if data is not None:
+                self.module_name = None
+                return data, True
+
+        self.facts = FileFacts()
+        data = self.analyze(content, filename)
+        if key is not None:
+            self.cache.store(key, data)
+        self.facts = None
+        self.module_name = None
+        return data, False
+
+    def abandon_file(self):
+        """Forget the current file, after its analysis failed part way through
+        (the nodes and edges it already added are kept)."""
+
+        self.name_stack = []
+        self.scope_stack = []
+        self.class_stack = []
+        self.last_value = None
+        self.ast_ids = {}
+        self.facts = None
+        self.module_name = None
+
+    def read(self, filename):
+        """Return the content of the specified Python source file."""
+
+        with open(filename, "rt", encoding="utf-8") as f:
+            return f.read()
+
+    def analyze(self, content, filename):
+        """Analyze the content of a Python source file (in the current module).
+
+        If the analysis is being recorded in self.facts, return the facts data."""
+
+        start = time.perf_counter()
         self.analyze_scopes(content, filename)
         self.visit(ast.parse(content, filename))
-        self.module_name = None
+        self.ast_ids = {}  # the AST is freed now, so its ids may be reused
+        if self.facts is not None:
+            return self.facts.to_data(time.perf_counter() - start)
+        return None
+
+    def facts_valid(self, data):
+        """Return whether replaying the facts data (see FileFacts) into this visitor
+        would give the same result as analyzing the file again.
+
+        This is the case exactly when every recorded lookup into shared state
+        still gives the recorded result. To check that without changing
+        anything, we simulate the nodes that replaying would create."""
+
+        missing = object()
+        new_nodes = {}       # (namespace, name): ast index, for nodes the replay would create
+        new_namespaces = {}  # ast index: namespace recorded for it by the replay
+        for op in data['ops']:
+            kind = op[0]
+            if kind == 'n':
+                key = (op[1], op[2])
+                if key not in new_nodes and self.find_node(op[1], op[2]) is None:
+                    new_nodes[key] = op[3]
+                    if op[3] >= 0:
+                        new_namespaces[op[3]] = op[1]
+            elif kind == 'a':
+                key = (op[1], op[2])
+                if key in new_nodes:
+                    result = new_namespaces.get(new_nodes[key], missing)
+                else:
+                    result = self.ast_node_to_namespace.get(self.find_node(op[1], op[2]).ast_id, missing)
+                if result != op[3]:
+                    return False
+            elif kind == 'm':
+                if self.module_names.get(op[1], op[1]) != op[2]:
+                    return False
+        return True
+
+    def replay(self, data):
+        """Apply recorded facts data (see FileFacts) instead of analyzing the file.
+
+        Returns False, without changing anything, if the facts are not valid
+        for the current state of the visitor."""
+
+        if not self.facts_valid(data):
+            return False
+
+        ast_nodes = [CachedAstNode(lineno, col_offset) for lineno, col_offset in data['locations']]
+        for op in data['ops']:
+            kind = op[0]
+            if kind == 'n':
+                self.get_node(op[1], op[2], ast_nodes[op[3]] if op[3] >= 0 else None)
+            elif kind == 'd':
+                self.add_defines_edge(self.find_node(op[1], op[2]), self.find_node(op[3], op[4]))
+            elif kind == 'u':
+                self.add_uses_edge(self.find_node(op[1], op[2]), self.find_node(op[3], op[4]))
+        self.ast_ids = {}
+        return True
 
     def postprocess(self):
         """Finalize the analysis by postprocessing the results."""
@@ -338,20 +698,20 @@ class CallGraphVisitor(ast.NodeVisitor):
         ns = self.module_name
         self.name_stack.append(ns)
         self.scope_stack.append(self.scopes[ns])
-        self.ast_node_to_namespace[node] = ns  # must be added manually since we don't self.get_node() here
+        self.ast_node_to_namespace[self.get_ast_id(node)] = ns  # must be added manually since we don't self.get_node() here
         self.generic_visit(node)  # visit the **children** of node
         self.scope_stack.pop()
         self.name_stack.pop()
         self.last_value = None
 
     def visit_ClassDef(self, node):
-        message("ClassDef %s" % (node.name), level=MsgLevel.DEBUG)
+        message("ClassDef %s", node.name, level=MsgLevel.DEBUG)
 
         from_node = self.get_current_namespace()
         ns = from_node.get_name()
         to_node = self.get_node(ns, node.name, node)
         if self.add_defines_edge(from_node, to_node):
-            message("Def from %s to Class %s" % (from_node, to_node), level=MsgLevel.INFO)
+            message("Def from %s to Class %s", from_node, to_node, level=MsgLevel.INFO)
 
         self.set_value(node.name, to_node)
 
@@ -368,7 +728,7 @@ class CallGraphVisitor(ast.NodeVisitor):
         self.class_stack.pop()
 
     def visit_FunctionDef(self, node):
-        message("FunctionDef %s" % (node.name), level=MsgLevel.DEBUG)
+        message("FunctionDef %s", node.name, level=MsgLevel.DEBUG)
 
 #        # Place instance members at class level in the call graph
 #        # TODO: brittle: breaks analysis if __init__ defines an internal helper class,
@@ -386,7 +746,7 @@ class CallGraphVisitor(ast.NodeVisitor):
         ns = from_node.get_name()
         to_node = self.get_node(ns, node.name, node)
         if self.add_defines_edge(from_node, to_node):
-            message("Def from %s to Function %s" % (from_node, to_node), level=MsgLevel.INFO)
+            message("Def from %s to Function %s", from_node, to_node, level=MsgLevel.INFO)
 
         self.set_value(node.name, to_node)
 
@@ -396,7 +756,8 @@ class CallGraphVisitor(ast.NodeVisitor):
         for d in node.args.defaults:
             self.visit(d)
         for d in node.args.kw_defaults:
-            self.visit(d)
+            if d is not None:  # keyword-only argument without a default
+                self.visit(d)
         for stmt in node.body:
             self.visit(stmt)
         self.scope_stack.pop()
@@ -417,12 +778,14 @@ class CallGraphVisitor(ast.NodeVisitor):
             for d in node.args.defaults:
                 self.visit(d)
             for d in node.args.kw_defaults:
-                self.visit(d)
+                if d is not None:
+                    self.visit(d)
             self.visit(node.body)  # single expr
         self.with_scope("lambda", process)
 
     def visit_Import(self, node):
-        message("Import %s" % [format_alias(x) for x in node.names], level=MsgLevel.DEBUG)
+        if verbosity >= MsgLevel.DEBUG:
+            message("Import %s", [format_alias(x) for x in node.names], level=MsgLevel.DEBUG)
 
         # TODO: add support for relative imports (path may be like "....something.something")
         # https://www.python.org/dev/peps/pep-0328/#id10
@@ -434,7 +797,7 @@ class CallGraphVisitor(ast.NodeVisitor):
             from_node = self.get_current_namespace()      # where it is being imported to, i.e. the **user**
             to_node  = self.get_node('', tgt_name, node)  # the thing **being used** (under the asname, if any)
             if self.add_uses_edge(from_node, to_node):
-                message("Use from %s to Import %s" % (from_node, to_node), level=MsgLevel.INFO)
+                message("Use from %s to Import %s", from_node, to_node, level=MsgLevel.INFO)
 
             # conversion: possible short name -> fully qualified name
             # (when analyzing a set of files in the same directory)
@@ -442,40 +805,46 @@ class CallGraphVisitor(ast.NodeVisitor):
                 mod_name = self.module_names[src_name]
             else:
                 mod_name = src_name
+            if self.facts is not None:
+                self.facts.module_lookup(src_name, mod_name)
             tgt_module = self.get_node('', mod_name, node)
             self.set_value(tgt_name, tgt_module)
 
     def visit_ImportFrom(self, node):
-        message("ImportFrom: from %s import %s" % (node.module, [format_alias(x) for x in node.names]), level=MsgLevel.DEBUG)
+        if verbosity >= MsgLevel.DEBUG:
+            message("ImportFrom: from %s import %s", node.module, [format_alias(x) for x in node.names], level=MsgLevel.DEBUG)
 
         tgt_name = node.module
         from_node = self.get_current_namespace()
         to_node = self.get_node('', tgt_name, node)  # module, in top-level namespace
         if self.add_uses_edge(from_node, to_node):
-            message("Use from %s to From %s" % (from_node, to_node), level=MsgLevel.INFO)
+            message("Use from %s to From %s", from_node, to_node, level=MsgLevel.INFO)
 
         if tgt_name in self.module_names:
             mod_name = self.module_names[tgt_name]
         else:
             mod_name = tgt_name
+        if self.facts is not None:
+            self.facts.module_lookup(tgt_name, mod_name)
 
         for import_item in node.names:
             name = import_item.name
             new_name = import_item.asname if import_item.asname is not None else name
             tgt_id = self.get_node(mod_name, name, node)  # we imported the identifier name from the module mod_name
             self.set_value(new_name, tgt_id)
-            message("From setting name %s to %s" % (new_name, tgt_id), level=MsgLevel.INFO)
+            message("From setting name %s to %s", new_name, tgt_id, level=MsgLevel.INFO)
 
     # TODO: where are Constants used? (instead of Num, Str, ...)
     def visit_Constant(self, node):
-        message("Constant %s" % (node.value), level=MsgLevel.DEBUG)
+        message("Constant %s", node.value, level=MsgLevel.DEBUG)
         t = type(node.value)
         tn = t.__name__
         self.last_value = self.get_node('', tn, node)
 
     # attribute access (node.ctx determines whether set (ast.Store) or get (ast.Load))
     def visit_Attribute(self, node):
-        message("Attribute %s of %s in context %s" % (node.attr, getname(node.value), type(node.ctx)), level=MsgLevel.DEBUG)
+        if verbosity >= MsgLevel.DEBUG:
+            message("Attribute %s of %s in context %s", node.attr, getname(node.value), type(node.ctx), level=MsgLevel.DEBUG)
 
         if isinstance(node.ctx, ast.Store):
             # this is the value being assigned (set by visit_Assign())
@@ -487,11 +856,13 @@ class CallGraphVisitor(ast.NodeVisitor):
             self.visit(node.value)
 
             if isinstance(self.last_value, Node):
-                ns = self.ast_node_to_namespace[self.last_value.ast_node]
+                ns = self.ast_node_to_namespace[self.last_value.ast_id]
+                if self.facts is not None:
+                    self.facts.namespace_lookup(self.last_value, ns)
                 if ns in self.scopes:
                     sc = self.scopes[ns]
                     sc.defs[node.attr] = save_last_value
-                    message('setattr %s on %s to %s' % (node.attr, self.last_value, save_last_value), level=MsgLevel.INFO)
+                    message('setattr %s on %s to %s', node.attr, self.last_value, save_last_value, level=MsgLevel.INFO)
 
             self.last_value = save_last_value
 
@@ -525,10 +896,12 @@ class CallGraphVisitor(ast.NodeVisitor):
             # get our Node object corresponding to node.value in the current ns
             value = self.get_value(getname(node.value))
             # use the original AST node attached to that Node to look up the object's ns
-            ns = self.ast_node_to_namespace[value.ast_node] if value is not None else None
+            ns = self.ast_node_to_namespace[value.ast_id] if value is not None else None
+            if self.facts is not None and value is not None:
+                self.facts.namespace_lookup(value, ns)
             if ns in self.scopes and node.attr in self.scopes[ns].defs:
                 result = self.scopes[ns].defs[node.attr]
-                message('getattr %s on %s returns %s' % (node.attr, value, result), level=MsgLevel.INFO)
+                message('getattr %s on %s returns %s', node.attr, value, result, level=MsgLevel.INFO)
                 self.last_value = result
                 return
 
@@ -539,13 +912,14 @@ class CallGraphVisitor(ast.NodeVisitor):
             else:
                 to_node = self.get_node(None, tgt_name, node)
             if self.add_uses_edge(from_node, to_node):
-                message("Use from %s to Getattr %s" % (from_node, to_node), level=MsgLevel.INFO)
+                message("Use from %s to Getattr %s", from_node, to_node, level=MsgLevel.INFO)
 
             self.last_value = to_node
 
     # name access (node.ctx determines whether set (ast.Store) or get (ast.Load))
     def visit_Name(self, node):
-        message("Name %s in context %s" % (node.id, type(node.ctx)), level=MsgLevel.DEBUG)
+        if verbosity >= MsgLevel.DEBUG:
+            message("Name %s in context %s", node.id, type(node.ctx), level=MsgLevel.DEBUG)
 
         if isinstance(node.ctx, ast.Store):
             # when we get here, self.last_value has been set by visit_Assign()
@@ -555,7 +929,7 @@ class CallGraphVisitor(ast.NodeVisitor):
             # TODO: we handle self by its name, not by being the first argument in a method
             current_class = self.get_current_class()
             if node.id == 'self' and current_class is not None:
-                message('name %s maps to %s' % (node.id, current_class), level=MsgLevel.INFO)
+                message('name %s maps to %s', node.id, current_class, level=MsgLevel.INFO)
                 self.last_value = current_class
                 return
 
@@ -567,7 +941,7 @@ class CallGraphVisitor(ast.NodeVisitor):
             if not isinstance(to_node, Node):
                 to_node = self.get_node(None, tgt_name, node)  # namespace=None means we don't know the namespace yet
             if self.add_uses_edge(from_node, to_node):
-                message("Use from %s to Name %s" % (from_node, to_node), level=MsgLevel.INFO)
+                message("Use from %s to Name %s", from_node, to_node, level=MsgLevel.INFO)
 
             self.last_value = to_node
 
@@ -623,12 +997,13 @@ class CallGraphVisitor(ast.NodeVisitor):
         # - tuple unpacking works as a separate mechanism on top of that
         #
         if len(node.targets) > 1:
-            message("Assign (chained with %d outputs)" % (len(node.targets)), level=MsgLevel.DEBUG)
+            message("Assign (chained with %d outputs)", len(node.targets), level=MsgLevel.DEBUG)
 
         values = sanitize(node.value)  # values is the same for each set of targets
         for targets in node.targets:
             targets = sanitize(targets)
-            message("Assign %s %s" % ([getname(x) for x in targets], [getname(x) for x in values]), level=MsgLevel.DEBUG)
+            if verbosity >= MsgLevel.DEBUG:
+                message("Assign %s %s", [getname(x) for x in targets], [getname(x) for x in values], level=MsgLevel.DEBUG)
             self.analyze_binding(targets, values)
 
     def visit_AnnAssign(self, node):
@@ -638,7 +1013,8 @@ class CallGraphVisitor(ast.NodeVisitor):
         targets = sanitize(node.target)
         values = sanitize(node.value)  # values is the same for each set of targets
 
-        message("AugAssign %s %s %s" % ([getname(x) for x in targets], type(node.op), [getname(x) for x in values]), level=MsgLevel.DEBUG)
+        if verbosity >= MsgLevel.DEBUG:
+            message("AugAssign %s %s %s", [getname(x) for x in targets], type(node.op), [getname(x) for x in values], level=MsgLevel.DEBUG)
 
         # TODO: maybe no need to handle tuple unpacking in AugAssign? (but simpler to use the same implementation)
         self.analyze_binding(targets, values)
@@ -706,7 +1082,8 @@ class CallGraphVisitor(ast.NodeVisitor):
                 self.visit(expr)
 
     def visit_Call(self, node):
-        message("Call %s" % (getname(node.func)), level=MsgLevel.DEBUG)
+        if verbosity >= MsgLevel.DEBUG:
+            message("Call %s", getname(node.func), level=MsgLevel.DEBUG)
 
         for arg in node.args:
             self.visit(arg)
@@ -720,16 +1097,42 @@ class CallGraphVisitor(ast.NodeVisitor):
     # TODO: any other interesting AST node types? Full list:
     # https://docs.python.org/3/library/ast.html#abstract-grammar
 
+    def find_node(self, namespace, name):
+        """Return the unique node matching the namespace and name, or None if it doesn't exist."""
+
+        return self.node_index.get((namespace, name))
+
+    def get_ast_id(self, ast_node):
+        """Return the id of an AST node of the file being analyzed.
+
+        Unlike id(), these ids stay unique after the AST has been freed."""
+
+        key = id(ast_node)
+        if key not in self.ast_ids:
+            self.ast_ids[key] = self.next_ast_id
+            self.next_ast_id += 1
+        return self.ast_ids[key]
+
     def get_node(self, namespace, name, ast_node=None):
         """Return the unique node matching the namespace and name.
-        Creates a new node if one doesn't already exist."""
+        Creates a new node if one doesn't already exist.
 
-        if name in self.nodes:
-            for n in self.nodes[name]:
-                if n.namespace == namespace:
-                    return n
+        ast_node may also be a Node, to use the AST node that Node was created from."""
+
+        if self.facts is not None:
+            self.facts.node(namespace, name, ast_node)
 
-        n = Node(namespace, name, ast_node)
+        n = self.find_node(namespace, name)
+        if n is not None:
+            return n
+
+        if ast_node is None:
+            n = Node(namespace, name)
+        elif isinstance(ast_node, Node):
+            n = Node(namespace, name, ast_node.ast_id, ast_node.file_id, ast_node.lineno, ast_node.col_offset)
+        else:
+            n = Node(namespace, name, self.get_ast_id(ast_node), self.file_id,
+                     getattr(ast_node, 'lineno', None), getattr(ast_node, 'col_offset', None))
 
         # HACK: make the scope info accessible for the visit_*() methods
         # that only have an AST node.
@@ -742,14 +1145,15 @@ class CallGraphVisitor(ast.NodeVisitor):
         # information, so we mediate this by saving the full name of the namespace
         # where each AST node came from when it is get_node()d for the first time.
         #
-        if ast_node is not None:
-            self.ast_node_to_namespace[ast_node] = namespace
-            message("Namespace for AST node %s (%s) recorded as '%s'" % (ast_node, name, namespace), level=MsgLevel.DEBUG)
+        if n.ast_id is not None:
+            self.ast_node_to_namespace[n.ast_id] = namespace
+            message("Namespace for AST node %s (%s) recorded as '%s'", ast_node, name, namespace, level=MsgLevel.DEBUG)
 
         if name in self.nodes:
             self.nodes[name].append(n)
         else:
             self.nodes[name] = [n]
+        self.node_index[(namespace, name)] = n
 
         return n
 
@@ -782,12 +1186,12 @@ class CallGraphVisitor(ast.NodeVisitor):
         if sc is not None:
             value = sc.defs[name]
             if isinstance(value, Node):
-                message('Get %s in %s, found in %s, value %s' % (name, self.scope_stack[-1], sc, value), level=MsgLevel.INFO)
+                message('Get %s in %s, found in %s, value %s', name, self.scope_stack[-1], sc, value, level=MsgLevel.INFO)
                 return value
             else:
-                message('Get %s in %s, found in %s: value %s is not a Node' % (name, self.scope_stack[-1], sc, value), level=MsgLevel.DEBUG)
+                message('Get %s in %s, found in %s: value %s is not a Node', name, self.scope_stack[-1], sc, value, level=MsgLevel.DEBUG)
         else:
-            message('Get %s in %s: no Node value (or name not in scope)' % (name, self.scope_stack[-1]), level=MsgLevel.DEBUG)
+            message('Get %s in %s: no Node value (or name not in scope)', name, self.scope_stack[-1], level=MsgLevel.DEBUG)
         return None
 
     def set_value(self, name, value):
@@ -803,11 +1207,11 @@ class CallGraphVisitor(ast.NodeVisitor):
         if sc is not None:
             if isinstance(value, Node):
                 sc.defs[name] = value
-                message('Set %s in %s to %s' % (name, sc, value), level=MsgLevel.INFO)
+                message('Set %s in %s to %s', name, sc, value, level=MsgLevel.INFO)
             else:
-                message('Set %s in %s: value %s is not a Node' % (name, sc, value), level=MsgLevel.DEBUG)
+                message('Set %s in %s: value %s is not a Node', name, sc, value, level=MsgLevel.DEBUG)
         else:
-            message('Set: name %s not in scope' % (name), level=MsgLevel.DEBUG)
+            message('Set: name %s not in scope', name, level=MsgLevel.DEBUG)
 
     def analyze_scopes(self, code, filename):
         """Gather lexical scope information."""
@@ -829,7 +1233,7 @@ class CallGraphVisitor(ast.NodeVisitor):
         process(self.module_name, symtable.symtable(code, filename, compile_type="exec"))
         self.scopes = scopes
 
-        message("Scopes: %s" % (scopes), level=MsgLevel.DEBUG)
+        message("Scopes: %s", scopes, level=MsgLevel.DEBUG)
 
     def with_scope(self, scopename, thunk):
         """Run thunk (0-argument function) with the scope stack augmented with an inner scope.
@@ -846,10 +1250,12 @@ class CallGraphVisitor(ast.NodeVisitor):
         N.B. This will mark both nodes as defined."""
 
         if from_node not in self.defines_edges:
-            self.defines_edges[from_node] = set()
+            self.defines_edges[from_node] = {}
+        if self.facts is not None:
+            self.facts.edge('d', from_node, to_node)
         if to_node in self.defines_edges[from_node]:
             return False
-        self.defines_edges[from_node].add(to_node)
+        self.defines_edges[from_node][to_node] = None
         from_node.defined = True
         to_node.defined = True
         return True
@@ -858,84 +1264,133 @@ class CallGraphVisitor(ast.NodeVisitor):
         """Add a uses edge in the graph between two nodes."""
 
         if from_node not in self.uses_edges:
-            self.uses_edges[from_node] = set()
+            self.uses_edges[from_node] = {}
+        if self.facts is not None:
+            self.facts.edge('u', from_node, to_node)
         if to_node in self.uses_edges[from_node]:
             return False
-        self.uses_edges[from_node].add(to_node)
+        self.uses_edges[from_node][to_node] = None
         return True
 
     def contract_nonexistents(self):
-        """For all use edges to non-existent (i.e. not defined nodes) X.name, replace with edge to *.name."""
+        """For all use edges to non-existent (i.e. not defined nodes) X.name, replace with edge to *.name.
 
-        new_uses_edges = []
-        for n in self.uses_edges:
-            for n2 in self.uses_edges[n]:
-                if n2.namespace is not None and not n2.defined:
-                    n3 = self.get_node(None, n2.name, n2.ast_node)
-                    new_uses_edges.append((n, n3))
-                    message("Contracting non-existent from %s to %s" % (n, n2), level=MsgLevel.INFO)
+        The edges of each node are added to it directly, after listing the
+        non-existent nodes it uses, so no list of all new edges is built."""
 
-        for from_node, to_node in new_uses_edges:
-            self.add_uses_edge(from_node, to_node)
+        for n, used in self.uses_edges.items():
+            nonexistents = [n2 for n2 in used if n2.namespace is not None and not n2.defined]
+            for n2 in nonexistents:
+                n3 = self.get_node(None, n2.name, n2)
+                used[n3] = None
+                message("Contracting non-existent from %s to %s", n, n2, level=MsgLevel.INFO)
 
     def expand_unknowns(self):
-        """For each unknown node *.name, replace all its incoming edges with edges to X.name for all possible Xs."""
-
-        new_defines_edges = []
-        for n in self.defines_edges:
-            for n2 in self.defines_edges[n]:
-                if n2.namespace is None:
-                    for n3 in self.nodes[n2.name]:
-                        new_defines_edges.append((n, n3))
+        """For each unknown node *.name, replace all its incoming edges with edges to X.name for all possible Xs.
 
-        for from_node, to_node in new_defines_edges:
-            self.add_defines_edge(from_node, to_node)
+        The possible Xs come from the name index (self.nodes), and as in
+        contract_nonexistents(), the edges of each node are added directly."""
 
-        new_uses_edges = []
-        for n in self.uses_edges:
-            for n2 in self.uses_edges[n]:
-                if n2.namespace is None:
-                    for n3 in self.nodes[n2.name]:
-                        new_uses_edges.append((n, n3))
+        for n, defined in self.defines_edges.items():
+            unknowns = [n2 for n2 in defined if n2.namespace is None]
+            for n2 in unknowns:
+                for n3 in self.nodes[n2.name]:
+                    if n3 not in defined:
+                        defined[n3] = None
+                        n3.defined = True
 
-        for from_node, to_node in new_uses_edges:
-            self.add_uses_edge(from_node, to_node)
+        for n, used in self.uses_edges.items():
+            unknowns = [n2 for n2 in used if n2.namespace is None]
+            for n2 in unknowns:
+                for n3 in self.nodes[n2.name]:
+                    used[n3] = None
 
         for name in self.nodes:
-            for n in self.nodes[name]:
-                if n.namespace is None:
-                    n.defined = False
+            n = self.find_node(None, name)
+            if n is not None:
+                n.defined = False
 
     def cull_inherited(self):
         """For each use edge from W to X.name, if it also has an edge to W to Y.name where Y is used by X, then remove the first edge."""
 
-        removed_uses_edges = []
+        for from_node, to_node in self.find_inherited_edges():
+            message("Removing inherited edge from %s to %s", from_node, to_node, level=MsgLevel.INFO)
+            del self.uses_edges[from_node][to_node]
+
+    def find_inherited_edges(self):
+        """Return the list of use edges (from_node, to_node) removed by cull_inherited().
+
+        The edges from each node are grouped by name first, so that only
+        edges to the same name are compared, and the node representing each
+        namespace (X and Y in cull_inherited()) is looked up only once."""
+
+        parents = {}  # namespace: Node representing it, or None
+        def get_parent(namespace):
+            if namespace not in parents:
+                if '.' in namespace:
+                    nsp, p = namespace.rsplit('.', 1)
+                else:
+                    nsp, p = '', namespace
+                parents[namespace] = self.find_node(nsp, p)
+            return parents[namespace]
+
+        inherited_edges = []
         for n in self.uses_edges:
+            by_name = {}  # name: used nodes with that name (in known namespaces)
             for n2 in self.uses_edges[n]:
-                inherited = False
-                for n3 in self.uses_edges[n]:
-                    if n3.name == n2.name and n2.namespace is not None and n3.namespace is not None and n3.namespace != n2.namespace:
-                        if '.' in n2.namespace:
-                            nsp2,p2 = n2.namespace.rsplit('.', 1)
-                        else:
-                            nsp2,p2 = '',n2.namespace
-                        if '.' in n3.namespace:
-                            nsp3,p3 = n3.namespace.rsplit('.', 1)
+                if n2.namespace is not None:
+                    if n2.name in by_name:
+                        by_name[n2.name].append(n2)
+                    else:
+                        by_name[n2.name] = [n2]
+
+            inherited = set()
+            for group in by_name.values():
+                if len(group) < 2:
+                    continue
+
+                namespaces_of = {}  # parent node: namespaces of the nodes in group it represents
+                for n3 in group:
+                    pn3 = get_parent(n3.namespace)
+                    if pn3 is not None:
+                        if pn3 in namespaces_of:
+                            namespaces_of[pn3].append(n3.namespace)
                         else:
-                            nsp3,p3 = '',n3.namespace
-                        pn2 = self.get_node(nsp2, p2, None)
-                        pn3 = self.get_node(nsp3, p3, None)
-                        if pn2 in self.uses_edges and pn3 in self.uses_edges[pn2]:
-                            inherited = True
+                            namespaces_of[pn3] = [n3.namespace]
+
+                for n2 in group:
+                    pn2 = get_parent(n2.namespace)
+                    if pn2 not in self.uses_edges:
+                        continue
+                    used = self.uses_edges[pn2]
+                    if len(used) < len(namespaces_of):
+                        candidates = [pn3 for pn3 in used if pn3 in namespaces_of]
+                    else:
+                        candidates = [pn3 for pn3 in namespaces_of if pn3 in used]
+                    for pn3 in candidates:
+                        if any(ns != n2.namespace for ns in namespaces_of[pn3]):
+                            inherited.add(n2)
+                            break
 
-                if inherited and n in self.uses_edges:
-                    removed_uses_edges.append((n, n2))
-                    message("Removing inherited edge from %s to %s" % (n, n2), level=MsgLevel.INFO)
+            if inherited:
+                for n2 in self.uses_edges[n]:
+                    if n2 in inherited:
+                        inherited_edges.append((n, n2))
 
-        for from_node, to_node in removed_uses_edges:
-            self.uses_edges[from_node].remove(to_node)
+        return inherited_edges
 
     def to_dot(self, draw_defines, draw_uses, colored, grouped, nested_groups, annotate):
+        """Return the graph in GraphViz dot format, as a string. See iter_dot()."""
+        return ''.join(self.iter_dot(draw_defines, draw_uses, colored, grouped, nested_groups, annotate))
+
+    def to_tgf(self, draw_defines, draw_uses):
+        """Return the graph in Trivial Graph Format, as a string. See iter_tgf()."""
+        return ''.join(self.iter_tgf(draw_defines, draw_uses))
+
+    def iter_dot(self, draw_defines, draw_uses, colored, grouped, nested_groups, annotate):
+        """Generate the graph in GraphViz dot format, in pieces (lines), so that
+        it can be written out without building the whole output in memory."""
+
         if annotate:
             label_node = lambda n: n.get_annotated_name()
         else:
@@ -967,7 +1422,8 @@ class CallGraphVisitor(ast.NodeVisitor):
 
             def _get_idx(self, node):
                 ns = node.get_toplevel_namespace()
-                message("Coloring %s (top-level namespace %s)" % (node.get_short_name(), ns), level=MsgLevel.INFO)
+                if verbosity >= MsgLevel.INFO:
+                    message("Coloring %s (top-level namespace %s)", node.get_short_name(), ns, level=MsgLevel.INFO)
                 if ns not in self._idx_of:
                     self._idx_of[ns] = self._next_idx()
                 return self._idx_of[ns]
@@ -992,12 +1448,12 @@ class CallGraphVisitor(ast.NodeVisitor):
             return namespaces
         colorizer = Colorizer(n=len(find_toplevel_namespaces())+1)
 
-        s = """digraph G {\n"""
+        yield """digraph G {\n"""
 
         # enable clustering
         # http://www.graphviz.org/doc/info/attrs.html#a:clusterrank
         if grouped:
-            s += """    graph [clusterrank="local"];\n"""
+            yield """    graph [clusterrank="local"];\n"""
 
         # Write nodes and subgraphs
         #
@@ -1018,7 +1474,7 @@ class CallGraphVisitor(ast.NodeVisitor):
                         m = re.match(namespace_stack[-1], n.namespace)
                         # The '.' check catches siblings in cases like MeshGenerator vs. Mesh.
                         while m is None  or  n.namespace[m.end()] != '.':
-                            s += """%s}\n""" % indent  # terminate previous subgraph
+                            yield """%s}\n""" % indent  # terminate previous subgraph
                             namespace_stack.pop()
                             indent = update_indent()
                             if not len(namespace_stack):
@@ -1028,17 +1484,17 @@ class CallGraphVisitor(ast.NodeVisitor):
                     indent = update_indent()
                 else:
                     if prev_namespace != "":
-                        s += """%s}\n""" % indent  # terminate previous subgraph
+                        yield """%s}\n""" % indent  # terminate previous subgraph
                     else:
                         indent = " " * 4  # first subgraph begins, start indenting
                 prev_namespace = n.namespace
                 # Begin new subgraph for this namespace (TODO: refactor the label generation).
                 #
                 # Name must begin with "cluster" to be recognized as a cluster by GraphViz.
-                s += """%ssubgraph cluster_%s {\n""" % (indent, n.namespace.replace('.', '__').replace('*', ''))
+                yield """%ssubgraph cluster_%s {\n""" % (indent, n.namespace.replace('.', '__').replace('*', ''))
 
                 # translucent gray (no hue to avoid visual confusion with any group of colored nodes)
-                s += """%s    graph [style="filled,rounded", fillcolor="#80808018", label="%s"];\n""" % (indent, n.namespace)
+                yield """%s    graph [style="filled,rounded", fillcolor="#80808018", label="%s"];\n""" % (indent, n.namespace)
 
             # add the node itself
             if colored:
@@ -1053,20 +1509,20 @@ class CallGraphVisitor(ast.NodeVisitor):
                 else:
                     text_RGB = htmlize_rgb(1.0, 1.0, 1.0)  # white text on dark nodes
 
-                s += """%s    %s [label="%s", style="filled", fillcolor="%s", fontcolor="%s", group="%s"];\n""" % (indent, n.get_label(), label_node(n), fill_RGBA, text_RGB, idx)
+                yield """%s    %s [label="%s", style="filled", fillcolor="%s", fontcolor="%s", group="%s"];\n""" % (indent, n.get_label(), label_node(n), fill_RGBA, text_RGB, idx)
             else:
                 fill_RGBA = htmlize_rgb(1.0, 1.0, 1.0, 0.7)
                 idx,_ = colorizer.get(n)
-                s += """%s    %s [label="%s", style="filled", fillcolor="%s", fontcolor="#000000", group="%s"];\n""" % (indent, n.get_label(), label_node(n), fill_RGBA, idx)
+                yield """%s    %s [label="%s", style="filled", fillcolor="%s", fontcolor="#000000", group="%s"];\n""" % (indent, n.get_label(), label_node(n), fill_RGBA, idx)
 
         if grouped:
             if nested_groups:
                 while len(namespace_stack):
-                    s += """%s}\n""" % indent  # terminate all remaining subgraphs
+                    yield """%s}\n""" % indent  # terminate all remaining subgraphs
                     namespace_stack.pop()
                     indent = update_indent()
             else:
-                s += """%s}\n""" % indent  # terminate last subgraph
+                yield """%s}\n""" % indent  # terminate last subgraph
 
         # Write defines relationships
         #
@@ -1076,7 +1532,7 @@ class CallGraphVisitor(ast.NodeVisitor):
                     for n2 in self.defines_edges[n]:
                         if n2.defined and n2 != n:
                             # gray lines (so they won't visually obstruct the "uses" lines)
-                            s += """    %s -> %s [style="dashed", color="azure4"];\n""" % (n.get_label(), n2.get_label())
+                            yield """    %s -> %s [style="dashed", color="azure4"];\n""" % (n.get_label(), n2.get_label())
 
         # Write uses relationships
         #
@@ -1085,26 +1541,26 @@ class CallGraphVisitor(ast.NodeVisitor):
                 if n.defined:
                     for n2 in self.uses_edges[n]:
                         if n2.defined and n2 != n:
-                            s += """    %s -> %s;\n""" % (n.get_label(), n2.get_label())
+                            yield """    %s -> %s;\n""" % (n.get_label(), n2.get_label())
 
-        s += """}\n"""  # terminate "digraph G {"
-        return s
+        yield """}\n"""  # terminate "digraph G {"
 
 
-    def to_tgf(self, draw_defines, draw_uses):
-        s = ''
+    def iter_tgf(self, draw_defines, draw_uses):
+        """Generate the graph in Trivial Graph Format, in pieces (lines)."""
+
         i = 1
         id_map = {}
         for name in self.nodes:
             for n in self.nodes[name]:
                 if n.defined:
-                    s += """%d %s\n""" % (i, n.get_short_name())
+                    yield """%d %s\n""" % (i, n.get_short_name())
                     id_map[n] = i
                     i += 1
                 #else:
                 #    print("ignoring %s" % n, file=sys.stderr)
 
-        s += """#\n"""
+        yield """#\n"""
 
         if draw_defines:
             for n in self.defines_edges:
@@ -1113,7 +1569,7 @@ class CallGraphVisitor(ast.NodeVisitor):
                         if n2.defined and n2 != n:
                             i1 = id_map[n]
                             i2 = id_map[n2]
-                            s += """%d %d D\n""" % (i1, i2)
+                            yield """%d %d D\n""" % (i1, i2)
 
         if draw_uses:
             for n in self.uses_edges:
@@ -1122,12 +1578,792 @@ class CallGraphVisitor(ast.NodeVisitor):
                         if n2.defined and n2 != n:
                             i1 = id_map[n]
                             i2 = id_map[n2]
-                            s += """%d %d U\n""" % (i1, i2)
-        return s
+                            yield """%d %d U\n""" % (i1, i2)
+
+    def get_graph_tables(self, draw_defines, draw_uses):
+        """Return the graph as tables indexed by integer node ids, for the compact
+        export formats (see write_binary() and iter_jsonl()).
+
+        The nodes are the same as in the other formats, in the same order, and
+        numbered from 0. Return a dict with:
+            strings:  list of distinct strings (namespaces and names)
+            nodes:    list of (namespace string id, name string id, line) per node,
+                      where line is -1 if not known
+            defines, uses:  adjacency in CSR form, i.e. a pair (offsets, targets) of
+                      arrays of unsigned ints, where the targets of the edges from
+                      node i are targets[offsets[i]:offsets[i+1]]."""
+
+        nodes = [n for name in self.nodes for n in self.nodes[name] if n.defined]
+        node_ids = {n: i for i, n in enumerate(nodes)}
+
+        strings = []
+        string_ids = {}
+        def intern(string):
+            if string not in string_ids:
+                string_ids[string] = len(strings)
+                strings.append(string)
+            return string_ids[string]
+
+        node_table = [(intern(n.namespace), intern(n.name), n.lineno if n.lineno is not None else -1) for n in nodes]
+
+        def csr(edges, draw):
+            offsets = array('I', [0])
+            targets = array('I')
+            for n in nodes:
+                if draw and n in edges:
+                    for n2 in edges[n]:
+                        if n2.defined and n2 != n:
+                            targets.append(node_ids[n2])
+                offsets.append(len(targets))
+            return offsets, targets
+
+        return {'strings': strings,
+                'nodes': node_table,
+                'defines': csr(self.defines_edges, draw_defines),
+                'uses': csr(self.uses_edges, draw_uses)}
+
+    def write_binary(self, f, draw_defines, draw_uses):
+        """Write the graph to the binary file object f, in the format read by GraphFile."""
+
+        tables = self.get_graph_tables(draw_defines, draw_uses)
+
+        blob = bytearray()
+        string_offsets = array('I', [0])
+        for string in tables['strings']:
+            blob += string.encode("utf-8")
+            string_offsets.append(len(blob))
+        blob += b"\0" * (-len(blob) % 4)  # keep the following arrays aligned
+
+        namespaces = array('i', [ns for ns, name, line in tables['nodes']])
+        names = array('i', [name for ns, name, line in tables['nodes']])
+        lines = array('i', [line for ns, name, line in tables['nodes']])
+        defines_offsets, defines_targets = tables['defines']
+        uses_offsets, uses_targets = tables['uses']
+
+        f.write(struct.pack(GraphFile.HEADER, GraphFile.MAGIC, GraphFile.VERSION,
+                            len(namespaces), len(tables['strings']), len(blob),
+                            len(defines_targets), len(uses_targets)))
+        f.write(GraphFile.to_little_endian(string_offsets))
+        f.write(blob)
+        for a in (namespaces, names, lines, defines_offsets, defines_targets, uses_offsets, uses_targets):
+            f.write(GraphFile.to_little_endian(a))
+
+    def iter_jsonl(self, draw_defines, draw_uses):
+        """Generate the graph in JSON lines format, in pieces (lines).
+
+        This is the text fallback of write_binary(), with the same node ids:
+        a header line, then one line per node, then one line per edge."""
+
+        tables = self.get_graph_tables(draw_defines, draw_uses)
+        strings = tables['strings']
+
+        yield json.dumps({"format": "pyan-graph", "version": GraphFile.VERSION,
+                          "nodes": len(tables['nodes']),
+                          "defines": len(tables['defines'][1]),
+                          "uses": len(tables['uses'][1])}) + "\n"
+        for i, (ns, name, line) in enumerate(tables['nodes']):
+            yield json.dumps({"id": i, "namespace": strings[ns], "name": strings[name], "line": line}) + "\n"
+        for kind in ("defines", "uses"):
+            offsets, targets = tables[kind]
+            for i in range(len(offsets) - 1):
+                for j in targets[offsets[i]:offsets[i+1]]:
+                    yield json.dumps({"from": i, "to": j, "kind": kind}) + "\n"
+
+
+class ModuleGraphVisitor(CallGraphVisitor):
+    """A CallGraphVisitor that only finds which modules import which (for --modules-only).
+
+    Each module is a Node in the top-level namespace, with a uses edge to each
+    module it imports. Only the module-level import statements are looked at,
+    including those in if/try/with blocks and class bodies, but not those in
+    function bodies. They are found by searching the source text (see
+    find_imports()), and only they are parsed, so there is no symtable and no
+    AST of the whole file. As elsewhere, only the analyzed modules are drawn."""
+
+    class DedentPatterns(dict):
+        """Regular expressions matching the next line of code (not blank or
+        a comment) indented by at most n characters, created as needed."""
+        def __missing__(self, n):
+            pattern = self[n] = re.compile(r"\n[ \t]{0,%d}[^ \t\r\n#]" % (n))
+            return pattern
+    DEDENT_LINE = DedentPatterns()
+
+    # a comment or a string literal (with any backslash escapes in it), or
+    # the opening quotes of a string that is never closed
+    STRING_OR_COMMENT = re.compile(r"""
+          \#[^\n]*
+        | \"\"\"[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*\"\"\"
+        | '''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''
+        | "[^"\\\n]*(?:\\.[^"\\\n]*)*"
+        | '[^'\\\n]*(?:\\.[^'\\\n]*)*'
+        | (?P<unterminated>\"\"\"|'''|["'])
+        """, re.DOTALL | re.VERBOSE)
+
+    def __init__(self, filenames):
+        super().__init__(filenames)
+        self.analyzed_modules = {get_module_name(filename) for filename in filenames}
+        self.package = []  # the package of the current module, as a list of names
+
+    def read(self, filename):
+        """Return the content of the specified Python source file, with any
+        bytes that are not UTF-8 replaced (only the import statements matter)."""
+
+        with open(filename, "rt", encoding="utf-8", errors="replace") as f:
+            return f.read()
+
+    def analyze(self, content, filename):
+        """Add the uses edges from the current module to the modules it imports."""
+
+        self.package = self.module_name.split('.')
+        if os.path.basename(filename) != '__init__.py':
+            self.package.pop()
+        module = self.get_node('', self.module_name)
+        module.defined = True
+        for stmt in self.find_imports(content):
+            self.visit(stmt)
+        return None
+
+    def find_imports(self, content):
+        """Return the list of AST nodes of the import statements outside function bodies in content.
+
+        The source is only searched for the words "import" and "def", after
+        finding the comments and string literals (see STRING_OR_COMMENT), so
+        that words in them are skipped. The lines where import starts a
+        statement, follows "from ..." or follows a one-line compound
+        statement header (e.g. "if x: import y") are parsed, unless they are
+        in the body of a def, which ends at the next line indented no more
+        than the def. This is much faster than parsing the whole file.
+
+        When the scanner is unsure (an unterminated string, or a line with an
+        import that does not parse on its own, e.g. "try: import y"), the
+        whole file is parsed instead (see parse_imports()), if it can be."""
+
+        # the spans (start, end) of the comments and string literals
+        starts = []
+        ends = []
+        unsure = False
+        for m in self.STRING_OR_COMMENT.finditer(content):
+            if m.lastgroup == 'unterminated':
+                unsure = True
+            else:
+                starts.append(m.start())
+                ends.append(m.end())
+        if unsure:
+            imports = self.parse_imports(content, "Unterminated string")
+            if imports is not None:
+                return imports
+
+        def inside(pos):  # the index in starts/ends of the comment or string pos is inside (after its first character), or None
+            k = bisect_right(starts, pos) - 1
+            if k >= 0 and starts[k] < pos < ends[k]:
+                return k
+            return None
+
+        def line_end(pos):
+            end = content.find('\n', pos)
+            return end if end >= 0 else len(content)
+
+        candidates = []
+        for word in ("def", "import"):
+            pos = content.find(word)
+            while pos >= 0:
+                candidates.append(pos)
+                pos = content.find(word, pos + len(word))
+        candidates.sort()
+
+        imports = []
+        body_end = 0  # end of the def body being skipped
+        statement_end = 0  # end of the last import statement
+        for pos in candidates:
+            is_def = content.startswith("def", pos)
+            following = content[pos+3:pos+4] if is_def else content[pos+6:pos+7]
+            if following not in (" ", "\t", "(", "\\"):
+                continue
+            if pos < statement_end or inside(pos) is not None:
+                continue
+            start = content.rfind('\n', 0, pos) + 1
+            k = inside(start)
+            while k is not None:  # the line starts in a string; go back to the line where it begins
+                start = content.rfind('\n', 0, starts[k]) + 1
+                k = inside(start)
+            if start < body_end:
+                continue
+            prefix = content[start:pos].lstrip(" \t")
+            indent = pos - start - len(prefix)
+
+            if is_def:
+                if prefix and not (prefix.startswith("async") and prefix[5:].isspace()):
+                    continue
+                end = line_end(pos)
+                depth = content.count('(', start, end) - content.count(')', start, end)
+                while depth > 0 and end < len(content):  # the rest of the signature
+                    next_end = line_end(end + 1)
+                    depth += content.count('(', end, next_end) - content.count(')', end, next_end)
+                    end = next_end
+                dedent = self.DEDENT_LINE[indent]
+                body = dedent.search(content, end)
+                k = inside(body.start() + 1) if body is not None else None
+                while k is not None:
+                    body = dedent.search(content, ends[k])
+                    k = inside(body.start() + 1) if body is not None else None
+                body_end = body.start() + 1 if body is not None else len(content)
+                continue
+
+            end = line_end(pos)
+            k = inside(end)
+            while k is not None:  # the line ends in a string; go on to the line where it ends
+                end = line_end(ends[k])
+                k = inside(end)
+            statement = content[start:end].strip()
+            while end < len(content):
+                if statement.endswith('\\'):
+                    statement = statement[:-1] + ' '
+                elif statement.count('(') > statement.count(')'):
+                    statement = statement + '\n'
+                else:
+                    break
+                next_end = line_end(end + 1)
+                statement += content[end+1:next_end].strip()
+                end = next_end
+            statement_end = end
+            try:
+                tree = ast.parse(statement)
+            except SyntaxError:
+                if prefix and (':' in prefix or ';' in prefix):
+                    # maybe a real statement, e.g. "else: import y" (which does not parse without its "if")
+                    whole = self.parse_imports(content, "Cannot parse '%s' alone" % (statement))
+                    if whole is not None:
+                        return whole
+                message("Skipping '%s' in %s", statement, self.module_name, level=MsgLevel.DEBUG)
+                continue
+            imports.extend(self.find_imports_in_ast(tree.body))
+        return imports
+
+    def parse_imports(self, content, reason):
+        """Return the list of import statements outside function bodies in
+        content by parsing the whole of it, or None if it does not parse."""
+
+        message("%s in %s, parsing the whole file", reason, self.module_name, level=MsgLevel.DEBUG)
+        try:
+            tree = ast.parse(content)
+        except SyntaxError:
+            return None
+        return list(self.find_imports_in_ast(tree.body))
+
+    def find_imports_in_ast(self, body):
+        """Generate the import statements in the list of AST statements body,
+        and in the blocks nested in them, except function bodies."""
+
+        for stmt in body:
+            if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+                yield stmt
+            elif isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for field in ('body', 'orelse', 'finalbody', 'handlers', 'cases'):
+                block = getattr(stmt, field, None)
+                if isinstance(block, list):
+                    yield from self.find_imports_in_ast(block)
+
+    def resolve_module(self, name, level=0):
+        """Return the full name of the module imported as name, relative to the
+        current package if level > 0 (the number of leading dots), or None if
+        that goes above the top-level package.
+
+        Like self.module_names in CallGraphVisitor, a name that is not one
+        of the analyzed modules may refer to an analyzed module next to the
+        current one; but only in the same package, since across a whole tree
+        a short name can refer to many modules."""
+
+        if level > 0:
+            if level - 1 > len(self.package):
+                return None
+            package = self.package[:len(self.package) - (level - 1)]
+            return '.'.join(package + [name] if name else package)
+        sibling = '.'.join(self.package + [name])
+        if name not in self.analyzed_modules and sibling in self.analyzed_modules:
+            return sibling
+        return name
+
+    def add_import_edge(self, mod_name):
+        """Add a uses edge from the current module to the module mod_name."""
+
+        if mod_name is None:
+            return
+        from_node = self.get_node('', self.module_name)
+        to_node = self.get_node('', mod_name)
+        if from_node is not to_node and self.add_uses_edge(from_node, to_node):
+            message("Use from %s to module %s", from_node, to_node, level=MsgLevel.INFO)
+
+    def visit_Import(self, node):
+        if verbosity >= MsgLevel.DEBUG:
+            message("Import %s", [format_alias(x) for x in node.names], level=MsgLevel.DEBUG)
+
+        for import_item in node.names:
+            self.add_import_edge(self.resolve_module(import_item.name))
+
+    def visit_ImportFrom(self, node):
+        if verbosity >= MsgLevel.DEBUG:
+            message("ImportFrom: from %s import %s", node.module, [format_alias(x) for x in node.names], level=MsgLevel.DEBUG)
+
+        mod_name = self.resolve_module(node.module, node.level)
+        for import_item in node.names:
+            # "from package import module" imports the module, if we have it
+            submodule = "%s.%s" % (mod_name, import_item.name) if mod_name else import_item.name
+            self.add_import_edge(submodule if submodule in self.analyzed_modules else mod_name)
 
+    def postprocess(self):
+        """Nothing to do, since all the Nodes are modules with known names."""
+        pass
+
+class GraphFile:
+    """A graph written by CallGraphVisitor.write_binary(), opened for reading.
+
+    The file is memory-mapped, and the tables are exposed as memoryviews of
+    the mapping, so opening even a large graph copies nothing. The format
+    (all integers 32-bit little-endian) is:
+
+        header          magic, version, number of nodes, number of strings,
+                        size of string data, number of defines edges, number of uses edges
+        string offsets  (strings + 1) unsigned ints; string i is data[offsets[i]:offsets[i+1]]
+        string data     UTF-8, padded with zeros to a multiple of 4 bytes
+        namespaces      string id of the namespace of each node
+        names           string id of the name of each node
+        lines           source line of each node, or -1
+        defines         CSR adjacency: (nodes + 1) offsets, then the target node ids
+        uses            likewise
+
+    Zero-copy access needs a little-endian machine (i.e. almost any)."""
+
+    MAGIC = b"PYANGRF\0"
+    VERSION = 1
+    HEADER = "<8sIIIIII"
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+
+        magic, version, n_nodes, n_strings, n_bytes, n_defines, n_uses = struct.unpack_from(self.HEADER, self._mmap)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError("%s is not a pyan graph file" % (path))
+        if version != self.VERSION:
+            self.close()
+            raise ValueError("%s has graph format version %d, expected %d" % (path, version, self.VERSION))
+        if sys.byteorder != "little":
+            self.close()
+            raise ValueError("Reading pyan graph files needs a little-endian machine")
+
+        self.pos = struct.calcsize(self.HEADER)
+        self.string_offsets = self._take(n_strings + 1, 'I')
+        self.string_data = self._take(n_bytes, 'B')
+        self.namespaces = self._take(n_nodes, 'i')
+        self.names = self._take(n_nodes, 'i')
+        self.lines = self._take(n_nodes, 'i')
+        self.defines_offsets = self._take(n_nodes + 1, 'I')
+        self.defines_targets = self._take(n_defines, 'I')
+        self.uses_offsets = self._take(n_nodes + 1, 'I')
+        self.uses_targets = self._take(n_uses, 'I')
+
+    def _take(self, count, fmt):
+        """Return a memoryview of the next count items of format fmt in the file."""
+        size = count * struct.calcsize(fmt)
+        view = memoryview(self._mmap)[self.pos:self.pos + size].cast(fmt)
+        self._views.append(view)
+        self.pos += size
+        return view
+
+    @staticmethod
+    def to_little_endian(a):
+        """Return the bytes of the array a in little-endian byte order."""
+        if sys.byteorder != "little":
+            a = array(a.typecode, a)
+            a.byteswap()
+        return a.tobytes()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the file. If views of it are still in use elsewhere (e.g. from
+        get_uses()), the mapping itself is closed when the last of them is freed."""
+        for view in self._views:
+            view.release()
+        self._views = []
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def get_string(self, i):
+        return bytes(self.string_data[self.string_offsets[i]:self.string_offsets[i+1]]).decode("utf-8")
+
+    def get_namespace(self, i):
+        """Return the namespace of node i."""
+        return self.get_string(self.namespaces[i])
+
+    def get_short_name(self, i):
+        """Return the short name (i.e. excluding the namespace) of node i."""
+        return self.get_string(self.names[i])
+
+    def get_name(self, i):
+        """Return the full name of node i."""
+        namespace = self.get_namespace(i)
+        name = self.get_short_name(i)
+        return namespace + '.' + name if namespace else name
+
+    def get_defines(self, i):
+        """Return the ids of the nodes defined by node i (as a memoryview)."""
+        return self.defines_targets[self.defines_offsets[i]:self.defines_offsets[i+1]]
+
+    def get_uses(self, i):
+        """Return the ids of the nodes used by node i (as a memoryview)."""
+        return self.uses_targets[self.uses_offsets[i]:self.uses_offsets[i+1]]
+
+class GraphQuery:
+    """Answers questions about the call graph of a (postprocessed) CallGraphVisitor.
+
+    The graph (the same nodes and edges as in the output formats) is indexed
+    once into integer adjacency lists in both directions; the queries are then
+    breadth-first searches, or Tarjan's strongly connected components.
+
+    Names may be given as full names (e.g. "pkg.mod.Class.method"), or as short
+    names, which stand for all the nodes with that name."""
+
+    def __init__(self, visitor):
+        self.nodes = [n for name in visitor.nodes for n in visitor.nodes[name] if n.defined]
+        node_ids = {n: i for i, n in enumerate(self.nodes)}
+        self.names = [n.get_name() for n in self.nodes]
+
+        self.id_by_full_name = {name: i for i, name in enumerate(self.names)}
+        self.ids_by_short_name = {}
+        for i, n in enumerate(self.nodes):
+            if n.name in self.ids_by_short_name:
+                self.ids_by_short_name[n.name].append(i)
+            else:
+                self.ids_by_short_name[n.name] = [i]
+
+        def index(edges):
+            adjacency = []
+            for n in self.nodes:
+                adjacency.append([node_ids[n2] for n2 in edges.get(n, ()) if n2.defined and n2 != n])
+            return adjacency
+        self.uses = index(visitor.uses_edges)
+        self.defines = index(visitor.defines_edges)
+        self.used_by = [[] for n in self.nodes]
+        for i, targets in enumerate(self.uses):
+            for j in targets:
+                self.used_by[j].append(i)
+
+    def resolve(self, name):
+        """Return the ids of the nodes matching name. Raise KeyError if there are none."""
+
+        if name in self.id_by_full_name:
+            return [self.id_by_full_name[name]]
+        if name in self.ids_by_short_name:
+            return self.ids_by_short_name[name]
+        raise KeyError("No node named '%s'" % (name))
+
+    def reachable(self, start_ids, adjacency):
+        """Return the ids of the nodes reachable from start_ids (excluding them,
+        unless on a cycle), nearest first."""
+
+        seen = set(start_ids)
+        order = []
+        queue = list(start_ids)
+        for i in queue:  # the queue grows while we iterate over it
+            for j in adjacency[i]:
+                if j not in seen:
+                    seen.add(j)
+                    order.append(j)
+                    queue.append(j)
+        return order
+
+    def callees(self, name):
+        """Return the full names of everything used by name, directly or indirectly."""
+        return [self.names[i] for i in self.reachable(self.resolve(name), self.uses)]
+
+    def callers(self, name):
+        """Return the full names of everything that uses name, directly or indirectly."""
+        return [self.names[i] for i in self.reachable(self.resolve(name), self.used_by)]
+
+    def shortest_path(self, source, target):
+        """Return a shortest chain of uses (as full names) from source to target, or None."""
+
+        targets = set(self.resolve(target))
+        previous = {i: None for i in self.resolve(source)}
+        queue = list(previous)
+        for i in queue:
+            if i in targets:
+                path = []
+                while i is not None:
+                    path.append(self.names[i])
+                    i = previous[i]
+                return path[::-1]
+            for j in self.uses[i]:
+                if j not in previous:
+                    previous[j] = i
+                    queue.append(j)
+        return None
+
+    def dead_code(self, entry_points, follow_defines=False):
+        """Return the full names of the definitions (everything but modules) that
+        are not reachable through uses from any of entry_points. With follow_defines,
+        everything defined by a reachable node is also considered reachable."""
+
+        start_ids = [i for name in entry_points for i in self.resolve(name)]
+        adjacency = self.uses
+        if follow_defines:
+            adjacency = [self.uses[i] + self.defines[i] for i in range(len(self.nodes))]
+        live = set(start_ids)
+        live.update(self.reachable(start_ids, adjacency))
+        return [self.names[i] for i, n in enumerate(self.nodes) if i not in live and n.namespace != '']
+
+    def cycles(self):
+        """Return the groups of mutually recursive nodes (strongly connected
+        components of the uses graph with more than one node), as lists of full names."""
+
+        # Tarjan's algorithm, iteratively (the graph may be deep).
+        index_of = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        components = []
+        counter = 0
+        for root in range(len(self.nodes)):
+            if root in index_of:
+                continue
+            work = [(root, 0)]
+            while work:
+                i, k = work.pop()
+                if k == 0:
+                    index_of[i] = lowlink[i] = counter
+                    counter += 1
+                    stack.append(i)
+                    on_stack.add(i)
+                if k < len(self.uses[i]):
+                    work.append((i, k + 1))
+                    j = self.uses[i][k]
+                    if j not in index_of:
+                        work.append((j, 0))
+                    elif j in on_stack:
+                        lowlink[i] = min(lowlink[i], index_of[j])
+                    continue
+                # all successors done
+                if lowlink[i] == index_of[i]:
+                    component = []
+                    while True:
+                        j = stack.pop()
+                        on_stack.discard(j)
+                        component.append(j)
+                        if j == i:
+                            break
+                    if len(component) > 1:
+                        components.append(sorted(self.names[j] for j in component))
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[i])
+        return components
+
+    def run(self, query):
+        """Answer a query given on the command line (see --query), as a list of lines."""
+
+        kind, _, args = query.partition(':')
+        args = [arg for arg in args.split(',') if arg]
+        if kind == 'callers' and len(args) == 1:
+            return self.callers(args[0])
+        elif kind == 'callees' and len(args) == 1:
+            return self.callees(args[0])
+        elif kind == 'path' and len(args) == 2:
+            path = self.shortest_path(args[0], args[1])
+            return [" -> ".join(path)] if path is not None else []
+        elif kind == 'dead' and len(args) >= 1:
+            return self.dead_code(args)
+        elif kind == 'cycles' and not args:
+            return [" ".join(component) for component in self.cycles()]
+        raise ValueError("Unknown query '%s'" % (query))
+
+class Watcher:
+    """Keeps the call graph of a set of files up to date as they change (--watch).
+
+    Files are polled for changes in their modification time and size, and
+    then their content hash. The facts recorded for each file (see FileFacts)
+    are kept in memory. When some files change, their facts are dropped,
+    and a fresh graph is built by replaying the facts of the unchanged files
+    and analyzing only the changed ones. Analyzing a file retracts what its
+    previous version contributed to the graph, as that version is no longer
+    replayed. A file whose facts are no longer valid after a change elsewhere
+    is re-analyzed automatically (see CallGraphVisitor.process()).
+
+    Deleted files are dropped from the graph, and come back if they reappear.
+    A file that cannot be analyzed (e.g. while it is half-saved) keeps its
+    previous version in the graph, and is tried again when it changes."""
+
+    def __init__(self, filenames, cache=None, jobs=1):
+        self.filenames = filenames
+        self.cache = cache  # only used for the initial build
+        self.jobs = jobs
+
+        self.stamps = {}  # filename: (mtime, size)
+        self.hashes = {}  # filename: hash of the content
+        self.facts = {}   # filename: facts data
+        self.failed = {}  # filename: hash of the content that could not be analyzed
+        self.visitor = None
+
+    def scan(self):
+        """Return the list of files that were changed, created or deleted since the last scan."""
+
+        changed = []
+        for filename in self.filenames:
+            try:
+                st = os.stat(filename)
+            except FileNotFoundError:
+                if filename in self.stamps or filename in self.failed:
+                    self.stamps.pop(filename, None)
+                    self.hashes.pop(filename, None)
+                    self.failed.pop(filename, None)
+                    changed.append(filename)
+                continue
+
+            stamp = (st.st_mtime_ns, st.st_size)
+            if self.stamps.get(filename) == stamp:
+                continue
+            self.stamps[filename] = stamp
+
+            try:
+                with open(filename, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            except OSError as e:
+                message("WARNING: cannot read '%s': %s", filename, e, level=MsgLevel.WARNING)
+                self.stamps[filename] = None  # try again at the next scan
+                continue
+            if self.hashes.get(filename) != digest and self.failed.get(filename) != digest:
+                self.hashes[filename] = digest
+                changed.append(filename)
+        return changed
+
+    def update(self):
+        """Rebuild the graph if any file has changed. Return the list of changed files."""
+
+        changed = self.scan()
+        if not changed and self.visitor is not None:
+            return changed
+
+        start = time.perf_counter()
+        present = [filename for filename in self.filenames if filename in self.stamps or filename in self.failed]
+
+        v = CallGraphVisitor(present)
+        facts = None
+        if self.visitor is None and self.jobs > 1:
+            v.cache = self.cache
+            try:
+                facts = v.process_files(present, jobs=self.jobs, record=True)
+            except Exception:
+                v = CallGraphVisitor(present)  # start over, file by file, to find the culprits
+        if facts is None:
+            v.cache = self.cache if self.visitor is None else None
+            facts = {}
+            failed = []
+            for filename in present:
+                data = None
+                if filename in changed:
+                    data = self.process(v, filename, None)
+                    if data is None:
+                        failed.append(filename)
+                elif filename not in self.failed:  # (else not changed since it could not be analyzed)
+                    data = self.process(v, filename, self.facts.get(filename))
+                if data is None:
+                    # keep the last version that could be analyzed (in the graph, if its facts are still valid)
+                    data = self.facts.get(filename)
+                    self.replay(v, filename, data)
+                if data is not None:
+                    facts[filename] = data
+            if self.visitor is not None and len(failed) == len(changed):
+                return []  # nothing could be analyzed or removed; keep the previous graph
+        self.facts = facts
+        v.cache = None
+        v.postprocess()
+        self.visitor = v
+
+        message("Rebuilt the graph of %d files in %.3f s (changed: %s)", len(present), time.perf_counter() - start, ", ".join(changed), level=MsgLevel.INFO)
+        return changed
+
+    def process(self, v, filename, facts):
+        """Analyze filename in the CallGraphVisitor v (replaying facts if valid), and return its facts data.
+
+        If the file cannot be analyzed, for any reason, log a warning, and
+        return None. Its hash is forgotten, so that it is analyzed again when
+        it changes."""
+
+        try:
+            data = v.process(filename, facts, record=True)
+        except Exception as e:  # e.g. a syntax error, or Python code that pyan doesn't understand
+            v.abandon_file()
+            message("WARNING: cannot analyze '%s', keeping its previous version: %s: %s", filename, type(e).__name__, e, level=MsgLevel.WARNING)
+            self.failed[filename] = self.hashes.pop(filename, None)
+            self.stamps.pop(filename, None)
+            return None
+        self.failed.pop(filename, None)
+        return data
+
+    def replay(self, v, filename, facts):
+        """Replay the facts data of a previous version of filename in the CallGraphVisitor v,
+        without analyzing the file. Return facts, or None if they are missing or no longer valid."""
+
+        if facts is None:
+            return None
+        v.module_name = get_module_name(filename)
+        v.file_id = v.file_ids[filename]
+        valid = v.replay(facts)
+        v.module_name = None
+        return facts if valid else None
+
+    def run(self, emit, interval):
+        """Poll for changes every interval seconds, and call emit(visitor) after each rebuild. Runs until interrupted."""
+
+        try:
+            while True:
+                if self.update():
+                    emit(self.visitor)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+def write_chunked(f, pieces, chunk_size=65536):
+    """Write an iterable of strings (e.g. from CallGraphVisitor.iter_dot()) to the file object f,
+    joining them into chunks of about chunk_size characters to keep the number of writes low."""
+
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= chunk_size:
+            f.write(''.join(chunk))
+            chunk = []
+            length = 0
+    if chunk:
+        f.write(''.join(chunk))
+
+def record_file(task):
+    """Worker for parallel mode: analyze one file on a fresh CallGraphVisitor.
+
+    task is a tuple (all filenames, filename, FactCache or None).
+    Return the result of CallGraphVisitor.record()."""
+
+    filenames, filename, cache = task
+    v = CallGraphVisitor(filenames)
+    v.cache = cache
+    return v.record(filename)
 
 def main():
-    usage = """usage: %prog FILENAME... [--dot|--tgf]"""
+    usage = """usage: %prog FILENAME... [--dot|--tgf|--jsonl|--binary -o FILE]"""
     desc = """Analyse one or more Python source files and generate an approximate call graph of the modules, classes and functions within them."""
     parser = OptionParser(usage=usage, description=desc)
     parser.add_option("--dot",
@@ -1136,6 +2372,12 @@ def main():
     parser.add_option("--tgf",
                       action="store_true", default=False,
                       help="output in Trivial Graph Format")
+    parser.add_option("--binary",
+                      action="store_true", default=False,
+                      help="output in compact binary format, with integer node ids and CSR adjacency arrays (needs -o)")
+    parser.add_option("--jsonl",
+                      action="store_true", default=False,
+                      help="output in JSON lines format (text version of --binary)")
     parser.add_option("-v", "--verbose",
                       action="store_true", default=False, dest="verbose",
                       help="verbose output")
@@ -1166,14 +2408,43 @@ def main():
     parser.add_option("-a", "--annotate",
                       action="store_true", default=False, dest="annotate",
                       help="annotate with module and source line number [dot only]")
+    parser.add_option("-o", "--output",
+                      dest="output", default=None, metavar="FILE",
+                      help="write the output to FILE instead of standard output")
+    parser.add_option("--modules-only",
+                      action="store_true", default=False, dest="modules_only",
+                      help="only graph which modules import which, from the module-level import statements (fast)")
+    parser.add_option("--cache-dir",
+                      dest="cache_dir", default=None, metavar="DIR",
+                      help="cache per-file analysis results in DIR, and reuse them for unchanged files")
+    parser.add_option("--cache-size",
+                      type="int", dest="cache_size", default=256, metavar="MB",
+                      help="maximum size of the cache directory in megabytes [default: %default]")
+    parser.add_option("--watch",
+                      action="store_true", default=False, dest="watch",
+                      help="keep running, and write the output again whenever the files change")
+    parser.add_option("--interval",
+                      type="float", dest="interval", default=0.5, metavar="SECONDS",
+                      help="how often to check the files for changes in --watch mode [default: %default]")
+    parser.add_option("-j", "--jobs",
+                      type="int", dest="jobs", default=1, metavar="N",
+                      help="analyze files in N parallel processes [default: %default]")
+    parser.add_option("--query",
+                      action="append", dest="queries", default=[], metavar="QUERY",
+                      help="answer QUERY instead of writing the graph; one of callers:NAME, callees:NAME, "
+                           "path:FROM,TO, dead:ENTRY[,ENTRY...], cycles (may be given several times)")
 
     options, args = parser.parse_args()
     filenames = [fn2 for fn in args for fn2 in glob(fn)]
+    if options.modules_only and (options.cache_dir is not None or options.watch or options.jobs > 1):
+        parser.error('--modules-only cannot be combined with --cache-dir, --watch or -j')
     if len(args) == 0:
         parser.error('Need one or more filenames to process')
 
     if options.nested_groups:
         options.grouped = True
+    if options.binary and (options.output is None or options.dot or options.tgf or options.jsonl):
+        parser.error('--binary needs -o FILE, and cannot be combined with other output formats')
 
     # TODO: use an int argument
     global verbosity
@@ -1182,24 +2453,97 @@ def main():
     elif options.verbose:
         verbosity = MsgLevel.INFO
 
-    # Process the set of files, TWICE: so that forward references are picked up
-    v = CallGraphVisitor(filenames)
-    for pas in range(2):
-        for filename in filenames:
-            message("========== pass %d for file '%s' ==========" % (pas+1, filename), level=MsgLevel.INFO)
-            v.process(filename)
+    # Process the set of files, once.
+    #
+    # (This used to run twice "so that forward references are picked up", but
+    #  a second pass can't add anything: process() rebuilds self.scopes from
+    #  scratch for every file, and every Node a file touches has already been
+    #  created by that same file in the first pass, with the same AST node.
+    #  Forward references end up as edges to unknown nodes *.name, which
+    #  postprocess() then resolves in expand_unknowns().)
+    cache = None
+    if options.cache_dir is not None:
+        cache = FactCache(options.cache_dir, options.cache_size * 1024 * 1024)
+
+    if options.watch:
+        watcher = Watcher(filenames, cache=cache, jobs=options.jobs)
+        watcher.run(lambda v: write_output(v, options), options.interval)
+        return
+
+    if options.modules_only:
+        v = ModuleGraphVisitor(filenames)
+    else:
+        v = CallGraphVisitor(filenames)
+    v.cache = cache
+    v.process_files(filenames, jobs=options.jobs)
     v.postprocess()
 
+    if v.cache is not None:
+        v.cache.evict()
+        message(v.cache.get_stats(), level=MsgLevel.INFO)
+
+    if options.queries:
+        query = GraphQuery(v)
+        for q in options.queries:
+            try:
+                result = query.run(q)
+            except (KeyError, ValueError) as e:
+                parser.error(e.args[0])
+            print("# %s" % (q))
+            for line in result:
+                print(line)
+        return
+
+    write_output(v, options)
+
+def write_output(v, options):
+    """Write the graph of the CallGraphVisitor v in the formats selected by the command-line options.
+
+    An output file is written under a temporary name first and then renamed,
+    so that readers (e.g. of a file updated by --watch) never see it half-written.
+    If writing fails, the temporary file is removed."""
+
+    if options.output is None:
+        write_text_output(v, options, sys.stdout)
+        sys.stdout.flush()
+        return
+
+    tmp_path = "%s.%d.tmp" % (options.output, os.getpid())
+    try:
+        if options.binary:
+            with open(tmp_path, "wb") as f:
+                v.write_binary(f, draw_defines=options.draw_defines,
+                               draw_uses=options.draw_uses)
+        else:
+            with open(tmp_path, "wt", encoding="utf-8") as f:
+                write_text_output(v, options, f)
+        os.replace(tmp_path, options.output)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def write_text_output(v, options, f):
+    """Write the graph of the CallGraphVisitor v to the text file object f,
+    in the text formats selected by the command-line options."""
+
     if options.dot:
-        print(v.to_dot(draw_defines=options.draw_defines,
-                       draw_uses=options.draw_uses,
-                       colored=options.colored,
-                       grouped=options.grouped,
-                       nested_groups=options.nested_groups,
-                       annotate=options.annotate))
+        write_chunked(f, v.iter_dot(draw_defines=options.draw_defines,
+                                    draw_uses=options.draw_uses,
+                                    colored=options.colored,
+                                    grouped=options.grouped,
+                                    nested_groups=options.nested_groups,
+                                    annotate=options.annotate))
+        f.write("\n")
     if options.tgf:
-        print(v.to_tgf(draw_defines=options.draw_defines,
-                       draw_uses=options.draw_uses))
+        write_chunked(f, v.iter_tgf(draw_defines=options.draw_defines,
+                                    draw_uses=options.draw_uses))
+        f.write("\n")
+    if options.jsonl:
+        write_chunked(f, v.iter_jsonl(draw_defines=options.draw_defines,
+                                      draw_uses=options.draw_uses))
 
 
 if __name__ == '__main__':
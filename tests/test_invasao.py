@@ -0,0 +1,101 @@
+import importlib.util
+import os
+import random
+import sys
+
+import pytest
+
+# O nome do arquivo tem hífens, então não dá para usar um import normal
+CAMINHO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "invasao-sem-builtin.py")
+especificacao = importlib.util.spec_from_file_location("invasao_sem_builtin", CAMINHO)
+invasao = importlib.util.module_from_spec(especificacao)
+# Registrado em sys.modules para as funções poderem ir para os processos do pool
+sys.modules["invasao_sem_builtin"] = invasao
+especificacao.loader.exec_module(invasao)
+
+
+@pytest.mark.parametrize("dia, mes, esperado", [
+    (12, 7, [12, 7, "12 de julho"]),
+    (15, 6, [15, 6, "15 de junho"]),
+    (30, 4, [30, 4, "30 de abril"]),
+    # Dia 0 é o dia 31...
+    (0, 0, [31, 0, "31 de dezembro"]),
+    (0, 1, [31, 1, "31 de janeiro"]),
+    # ...que passa para o mês seguinte quando o mês não tem 31 dias
+    (0, 2, [3, 3, "3 de março"]),
+    (0, 11, [1, 0, "1 de dezembro"]),
+    (29, 2, [1, 3, "1 de março"]),
+    (30, 2, [2, 3, "2 de março"]),
+    (30, 11, [30, 11, "30 de novembro"]),
+    # Fora da tabela (os métodos nunca geram isso)
+    (45, 1, [14, 2, "14 de fevereiro"]),
+    (-1, 1, [31, 0, "31 de dezembro"]),
+])
+def test_data_corrigida(dia, mes, esperado):
+    assert invasao.data_corrigida(dia, mes) == esperado
+
+
+def test_tabela_de_datas_so_tem_datas_validas():
+    for dia in range(0, 31):
+        for mes in range(0, 12):
+            corrigido = invasao.data_corrigida(dia, mes)
+            assert 0 <= corrigido[1] < 12
+            assert 1 <= corrigido[0] <= invasao.MAXIMOS_POR_MES[corrigido[1]]
+            assert corrigido[2] == "%d de %s" % (corrigido[0], invasao.NOMES_DOS_MESES[corrigido[1]])
+            if 1 <= dia <= invasao.MAXIMOS_POR_MES[mes]:
+                # Datas que já estão certas não mudam
+                assert corrigido[:2] == [dia, mes]
+
+
+@pytest.mark.parametrize("entrada, metodo, data", [
+    ("3 4 50 2 13 67 4 23 18", "B", "5 de dezembro"),
+    ("5, 6, 22, 122, 34, 67, 89, 32, 189, 25, 53, 67, 125.", "A", "12 de julho"),
+    ("5, 6, 22, 123, 34, 67, 89, 32, 189, 25, 53, 67, 125.", "B", "22 de maio"),
+])
+def test_resolucao_e_modo_em_lote(entrada, metodo, data, capsys):
+    assert invasao.resolucao(entrada) == data
+    assert "Resp.: " + data in capsys.readouterr().out
+
+    registro = invasao.decodificar_mensagem(invasao.converter_para_numeros(entrada))
+    assert registro[0] == metodo
+    assert registro[3] == data
+
+
+@pytest.mark.parametrize("tamanho", [0, 1, 2, 10, 16, 17, 100, 1000])
+def test_ordenar_lista(tamanho):
+    gerador = random.Random(tamanho)
+    for lista in [[gerador.randint(0, 499) for i in range(0, tamanho)],
+                  [gerador.randint(-10 ** 9, 10 ** 9) for i in range(0, tamanho)],
+                  [gerador.random() for i in range(0, tamanho)]]:
+        original = list(lista)
+        assert invasao.ordenar_lista(lista) == sorted(original)
+        assert invasao.ordenar_por_intercalacao(lista) == sorted(original)
+        # A lista original não muda
+        assert lista == original
+
+
+@pytest.mark.skipif(invasao.numpy is None, reason="precisa do NumPy")
+def test_resolucao_em_lote_numpy():
+    mensagens = invasao.gerar_mensagens(5000) + ["", "9 1 2", "1 11 3", "2 1 500 3 4", "1 3 7 " + "9" * 30 + " 1 2"]
+    numpy_ = list(invasao.resolucao_em_lote_numpy(mensagens, tamanho_do_bloco=1000))
+    python = list(invasao.resolucao_em_lote(mensagens))
+
+    assert [invasao.registro_para_linha(registro) for registro in numpy_] == \
+        [invasao.registro_para_linha(registro) for registro in python]
+
+
+def test_resolver_arquivo_em_paralelo(tmp_path):
+    mensagens = invasao.gerar_mensagens(3000) + ["", "9 1 2", "1 11 3"]
+    caminho = tmp_path / "mensagens.txt"
+    caminho.write_text("\n".join(mensagens) + "\n", encoding="utf-8")
+
+    with open(caminho, "rb") as entrada, open(tmp_path / "serial.txt", "w", encoding="utf-8") as saida, \
+            open(tmp_path / "serial.rej", "wb") as rejeitadas:
+        serial = invasao.resolver_arquivo(entrada, saida, rejeitadas=rejeitadas, linhas_por_bloco=500)
+    with open(tmp_path / "paralelo.txt", "w", encoding="utf-8") as saida, \
+            open(tmp_path / "paralelo.rej", "wb") as rejeitadas:
+        paralelo = invasao.resolver_arquivo_em_paralelo(str(caminho), saida, 2, 4096, rejeitadas=rejeitadas)
+
+    assert serial == paralelo == [len(mensagens), 3]
+    assert (tmp_path / "serial.txt").read_text(encoding="utf-8") == (tmp_path / "paralelo.txt").read_text(encoding="utf-8")
+    assert (tmp_path / "serial.rej").read_bytes() == (tmp_path / "paralelo.rej").read_bytes()
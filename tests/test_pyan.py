@@ -0,0 +1,158 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pyan
+
+
+INHERITANCE = '''\
+class Base:
+    def run(self):
+        self.step()
+    def step(self):
+        pass
+    def close(self):
+        pass
+
+class Child(Base):
+    def step(self):
+        Base.step(self)
+    def close(self):
+        self.step()
+
+class GrandChild(Child):
+    def run(self):
+        Child.run(self)
+
+def main():
+    c = GrandChild()
+    c.run()
+    c.step()
+    c.close()
+    b = Base()
+    b.close()
+'''
+
+
+def analyze(filenames):
+    v = pyan.CallGraphVisitor(filenames)
+    v.process_files(filenames)
+    return v
+
+
+def find_inherited_edges_pairwise(v):
+    """The original quadratic cull_inherited test: compare every pair of use
+    edges from each node."""
+
+    inherited_edges = []
+    for n in v.uses_edges:
+        for n2 in v.uses_edges[n]:
+            inherited = False
+            for n3 in v.uses_edges[n]:
+                if n3.name == n2.name and n2.namespace is not None and n3.namespace is not None and n3.namespace != n2.namespace:
+                    if '.' in n2.namespace:
+                        nsp2,p2 = n2.namespace.rsplit('.', 1)
+                    else:
+                        nsp2,p2 = '',n2.namespace
+                    if '.' in n3.namespace:
+                        nsp3,p3 = n3.namespace.rsplit('.', 1)
+                    else:
+                        nsp3,p3 = '',n3.namespace
+                    pn2 = v.find_node(nsp2, p2)
+                    pn3 = v.find_node(nsp3, p3)
+                    if pn2 in v.uses_edges and pn3 in v.uses_edges[pn2]:
+                        inherited = True
+
+            if inherited:
+                inherited_edges.append((n, n2))
+
+    return inherited_edges
+
+
+@pytest.mark.parametrize("sources", ["inheritance", "pyan"])
+def test_find_inherited_edges_matches_pairwise(sources, tmp_path):
+    if sources == "inheritance":
+        filename = tmp_path / "inheritance.py"
+        filename.write_text(INHERITANCE)
+        filenames = [str(filename)]
+    else:
+        filenames = [os.path.join(ROOT, "pyan.py")]
+
+    v = analyze(filenames)
+    v.contract_nonexistents()
+    v.expand_unknowns()
+
+    inherited = v.find_inherited_edges()
+    assert inherited == find_inherited_edges_pairwise(v)
+    if sources == "inheritance":
+        assert inherited
+
+
+def node_names(v):
+    return sorted(n.get_name() for ns in v.nodes.values() for n in ns if n.defined)
+
+
+def test_watcher_keeps_going_when_analysis_fails(tmp_path, capsys):
+    # "m.f()" on an imported module makes visit_Attribute raise KeyError
+    m = tmp_path / "m.py"
+    m.write_text("def f():\n    pass\n")
+    user = tmp_path / "user.py"
+    user.write_text("def g():\n    pass\n")
+    watcher = pyan.Watcher([str(m), str(user)])
+
+    assert watcher.update() == [str(m), str(user)]
+    before = node_names(watcher.visitor)
+    assert "user.g" in before
+
+    user.write_text("import m\n\ndef h():\n    m.f()\n")
+    os.utime(user, ns=(1, 1))  # a new stamp, even if the write was within the mtime resolution
+    assert watcher.update() == []
+    assert "cannot analyze '%s'" % user in capsys.readouterr().err
+    assert node_names(watcher.visitor) == before
+
+    # unchanged: not analyzed (nor warned about) again
+    assert watcher.update() == []
+    assert capsys.readouterr().err == ""
+
+    user.write_text("def h():\n    pass\n")
+    assert watcher.update() == [str(user)]
+    assert "user.h" in node_names(watcher.visitor)
+    assert "user.g" not in node_names(watcher.visitor)
+
+
+def test_watcher_starts_when_analysis_fails(tmp_path, capsys):
+    m = tmp_path / "m.py"
+    m.write_text("def f():\n    pass\n")
+    user = tmp_path / "user.py"
+    user.write_text("import m\n\ndef h():\n    m.f()\n")
+    watcher = pyan.Watcher([str(m), str(user)])
+
+    watcher.update()
+    assert "cannot analyze '%s'" % user in capsys.readouterr().err
+    assert "m.f" in node_names(watcher.visitor)
+
+
+def imported_names(source):
+    v = pyan.ModuleGraphVisitor([])
+    v.module_name = "example"
+    return [alias.name for node in v.find_imports(source) for alias in node.names]
+
+
+@pytest.mark.parametrize("source, expected", [
+    ('s = """a \\""" b"""\nimport os\n', ["os"]),
+    ("s = '''a \\''' b'''\nimport os\n", ["os"]),
+    ('s = "a \\" import b"\nimport os\n', ["os"]),
+    ('x = """a\nb"""; import os\n', ["os"]),
+    ('x = """\nimport a\n"""\nimport os\n', ["os"]),
+    ("class A: import a\n", ["a"]),
+    ("if x: import a\nelse: import b\n", ["a", "b"]),
+    ("try: import a\nexcept ImportError: import b\n", ["a", "b"]),
+    ("x = 1; import os\n", ["os"]),
+    ('def f():\n    """\nimport a\n"""\n    import b\nimport c\n', ["c"]),
+])
+def test_find_imports(source, expected):
+    assert imported_names(source) == expected